@@ -11,6 +11,7 @@ Classes:
 - Treatment: Represents treatment information for a patient.
 - Demographic: Represents demographic information of a patient.
 - Molecular: Represents molecular test results for a patient.
+- GeneStatusMatrix: Represents the sparse patient x gene test result matrix.
 
 """
 
@@ -61,4 +62,17 @@ class Molecular:
     def __init__(self, analysis_method, test_result, gene_symbol):
         self.analysis_method = analysis_method
         self.test_result = test_result
-        self.gene_symbol = gene_symbol
\ No newline at end of file
+        self.gene_symbol = gene_symbol
+
+
+class GeneStatusMatrix:
+
+    def __init__(self, patient_ids, genes, matrix):
+        # matrix is a scipy CSR matrix, rows follow patient_ids and columns follow genes
+        self.patient_ids = patient_ids
+        self.genes = genes
+        self.matrix = matrix
+
+        self.gender = None
+        self.age = None
+        self.subtype = None
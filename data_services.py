@@ -1,4 +1,14 @@
 import json,csv
+import os
+import bz2
+import codecs
+import gzip
+import lzma
+import queue
+import re
+import threading
+import numpy as np
+from scipy import sparse
 from data_models import *
 
 """
@@ -14,14 +24,67 @@ Components:
 - DataClassification: Classifies the data to subtypes.
 - DataCreator: Generates the data by loading raw data, processing it, and exporting it 
   into CSV format for training the model.
+- GeneMatrixStore: Saves and loads the sparse patient x gene status matrix (.npz).
+- CompressedFileHandler: Opens gzip/bzip2/xz/zstd compressed or plain files transparently.
+- JsonStreamReader: Streams the cases of a JSON array while a background thread reads and decompresses.
+- DatasetSummary: Aggregates counts and histograms of the exported rows into a small JSON sidecar.
 
 """
 
 class DataMapper:
     """
     Create objects from raw JSON data to finally build a Patient object out of the data and it's relevant objects.
+    Only the declared fields are materialized, fields that are not requested stay None on the Patient.
     """
 
+    ALL_FIELDS = {
+        'submitter_id', 'project_id', 'disease_type', 'consent_type',
+        'demographic.gender', 'demographic.age', 'demographic.race', 'demographic.vital_status',
+        'diagnoses', 'treatments', 'molecular'
+    }
+    # Top-level case key that holds each field
+    RAW_KEYS = {
+        'submitter_id': 'submitter_id',
+        'project_id': 'project',
+        'disease_type': 'disease_type',
+        'consent_type': 'consent_type',
+        'demographic.gender': 'demographic',
+        'demographic.age': 'demographic',
+        'demographic.race': 'demographic',
+        'demographic.vital_status': 'demographic',
+        'diagnoses': 'diagnoses',
+        'treatments': 'diagnoses',
+        'molecular': 'follow_ups'
+    }
+
+    def __init__(self, fields=None):
+        if fields is None or fields == 'all':
+            fields = self.ALL_FIELDS
+        fields = set(fields)
+        if 'demographic' in fields:
+            fields = (fields - {'demographic'}) | {f for f in self.ALL_FIELDS if f.startswith('demographic.')}
+        unknown = fields - self.ALL_FIELDS
+        if unknown:
+            raise ValueError(f"Unknown patient fields: {sorted(unknown)}")
+        self.fields = fields
+
+    def raw_keys(self):
+        """
+        Returns the top-level case keys the declared fields are read from.
+        """
+        return {self.RAW_KEYS[field] for field in self.fields}
+
+    def get_field(self, patient, field):
+        """
+        Returns the value of a mapped field (e.g. 'project_id' or 'demographic.gender') of a Patient.
+        """
+        if field not in self.fields:
+            raise ValueError(f"Field '{field}' is not mapped, add it to the DataCreator fields.")
+        if field.startswith('demographic.'):
+            attribute = {'demographic.age': 'age'}.get(field, field[len('demographic.'):])
+            return getattr(patient.demographic, attribute)
+        return getattr(patient, field)
+
     def map_diagnosis_data(self, data):
         """
         Create Diagnosis object from raw JSON data.
@@ -31,17 +94,20 @@ class DataMapper:
         treatments_list = []
 
         for diagnosis in diagnoses_data:
+            if 'treatments' in self.fields:
+                treatments_list.append(self.map_treatment_data(diagnosis))
+            if 'diagnoses' not in self.fields:
+                continue
+
             tissue_or_organ_of_origin = diagnosis.get("tissue_or_organ_of_origin", "Unknown")
             primary_diagnosis = diagnosis.get("primary_diagnosis", "Unknown")
             state = diagnosis.get("state", "Unknown")
             method_of_diagnosis = diagnosis.get("method_of_diagnosis", "Unknown")
             submitter_id = diagnosis.get("submitter_id", "Unknown")
             classification_of_tumor = diagnosis.get("classification_of_tumor", "Unknown")
-            treatment_list = self.map_treatment_data(diagnosis)
 
             diagnosis_obj = Diagnosis(tissue_or_organ_of_origin, primary_diagnosis, state, method_of_diagnosis, submitter_id, classification_of_tumor  )
             diagnosis_list.append(diagnosis_obj)
-            treatments_list.append(treatment_list)
         
         return diagnosis_list, treatments_list
         
@@ -51,10 +117,10 @@ class DataMapper:
         Create Demographic object from raw JSON data.
         """
         demographic_data = data.get("demographic", {})
-        gender = demographic_data.get("gender", "Unknown")
-        age = demographic_data.get("age_at_index", "Unknown")
-        race = demographic_data.get("race", "Unknown")
-        vital_status = demographic_data.get("vital_status", "Unknown")
+        gender = demographic_data.get("gender", "Unknown") if 'demographic.gender' in self.fields else None
+        age = demographic_data.get("age_at_index", "Unknown") if 'demographic.age' in self.fields else None
+        race = demographic_data.get("race", "Unknown") if 'demographic.race' in self.fields else None
+        vital_status = demographic_data.get("vital_status", "Unknown") if 'demographic.vital_status' in self.fields else None
         demographic_obj = Demographic(gender, age, race, vital_status)
 
         return demographic_obj
@@ -101,23 +167,25 @@ class DataMapper:
         """
         Build Patient object from raw JSON data and it's relevant objects.
         """
-        disease_type = data.get("disease_type", "Unknown")
-        project_id = data.get("project", {}).get("project_id", "Unknown")
-        submitter_id = data.get("submitter_id", "Unknown")
-        consent_type = data.get("consent_type", "Unknown")
-        
-        diagnoses_output = self.map_diagnosis_data(data)
-        diagnoses = diagnoses_output[0]
-        treatments = diagnoses_output[1]
-
-        demographic = self.map_demographic_data(data)
-        molecular = self.map_molecular_data(data)
+        fields = self.fields
+        disease_type = data.get("disease_type", "Unknown") if 'disease_type' in fields else None
+        project_id = data.get("project", {}).get("project_id", "Unknown") if 'project_id' in fields else None
+        submitter_id = data.get("submitter_id", "Unknown") if 'submitter_id' in fields else None
+        consent_type = data.get("consent_type", "Unknown") if 'consent_type' in fields else None
 
         patient = Patient(disease_type, project_id, submitter_id, consent_type)
-        patient.diagnosis = diagnoses
-        patient.treatment = treatments
-        patient.demographic = demographic
-        patient.molecular = molecular
+
+        if 'diagnoses' in fields or 'treatments' in fields:
+            diagnoses_output = self.map_diagnosis_data(data)
+            if 'diagnoses' in fields:
+                patient.diagnosis = diagnoses_output[0]
+            if 'treatments' in fields:
+                patient.treatment = diagnoses_output[1]
+
+        if any(field.startswith('demographic.') for field in fields):
+            patient.demographic = self.map_demographic_data(data)
+        if 'molecular' in fields:
+            patient.molecular = self.map_molecular_data(data)
 
         return patient
     
@@ -127,8 +195,28 @@ class DataFilter:
     Filters data from the gene symbols and test results.
     """
 
-    def get_molecular_gene_result_filtered(self, list_patients):
-        gene_symbols = ['PGR', 'ESR1', 'ERBB2']
+    # Patient fields read by the filters (see DataMapper.ALL_FIELDS)
+    REQUIRED_FIELDS = {'submitter_id', 'molecular'}
+
+    # Default panel, the receptor markers used for subtype classification
+    GENE_PANEL = ['ESR1', 'PGR', 'ERBB2']
+    # Sparse status encoding, anything else (missing, equivocal, ...) stays 0
+    STATUS_CODES = {'Positive': 1, 'Negative': -1}
+
+    def resolve_gene_panel(self, gene_panel=None):
+        """
+        Returns the list of genes to keep, or None for "all genes seen".
+        """
+        if gene_panel is None:
+            return list(self.GENE_PANEL)
+        if gene_panel == 'all':
+            return None
+        if isinstance(gene_panel, str):
+            return [gene_panel]
+        return list(gene_panel)
+
+    def get_molecular_gene_result_filtered(self, list_patients, gene_panel=None):
+        gene_symbols = self.resolve_gene_panel(gene_panel)
         test_results = {'Negative', 'Positive'}
         
         
@@ -136,7 +224,9 @@ class DataFilter:
         for patient in list_patients:
             gene_result_map = {}
             for i, molecular in enumerate(patient.molecular):
-                if molecular.gene_symbol in gene_symbols and molecular.test_result in test_results:
+                if gene_symbols is not None and molecular.gene_symbol not in gene_symbols:
+                    continue
+                if molecular.test_result in test_results:
                     gene_result_map[molecular.gene_symbol] = molecular.test_result
 
             if not gene_result_map:
@@ -150,6 +240,50 @@ class DataFilter:
             patient_data = {'Patient' : patient.submitter_id, 'Result': final_results}
             patients.append(patient_data)
         return patients
+
+    def build_gene_status_matrix(self, list_patients, gene_panel=None, keep_empty=False):
+        """
+        Builds a sparse patient x gene status matrix in one pass over Patient.molecular.
+        Only Positive/Negative results are stored, so memory scales with the number of
+        non-missing results instead of panel size x patients.
+        keep_empty keeps patients without any panel result as all-missing rows.
+        """
+        panel = self.resolve_gene_panel(gene_panel)
+        gene_index = {gene: i for i, gene in enumerate(panel)} if panel is not None else {}
+        genes = list(panel) if panel is not None else []
+
+        rows, cols, values = [], [], []
+        patient_ids = []
+        for patient in list_patients:
+            status_map = {}
+            for molecular in patient.molecular:
+                code = self.STATUS_CODES.get(molecular.test_result)
+                # "Unknown" is the mapper's placeholder for a missing gene symbol, not a gene
+                if code is None or molecular.gene_symbol == "Unknown":
+                    continue
+                col = gene_index.get(molecular.gene_symbol)
+                if col is None:
+                    if panel is not None:
+                        continue
+                    col = gene_index[molecular.gene_symbol] = len(genes)
+                    genes.append(molecular.gene_symbol)
+                # Later results overwrite earlier ones, like the filtered map above
+                status_map[col] = code
+
+            if not status_map and not keep_empty:
+                continue
+
+            row = len(patient_ids)
+            patient_ids.append(patient.submitter_id)
+            rows.extend([row] * len(status_map))
+            cols.extend(status_map.keys())
+            values.extend(status_map.values())
+
+        matrix = sparse.csr_matrix(
+            (np.array(values, dtype=np.int8), (np.array(rows, dtype=np.int32), np.array(cols, dtype=np.int32))),
+            shape=(len(patient_ids), len(genes))
+        )
+        return GeneStatusMatrix(patient_ids, genes, matrix)
     
     
             
@@ -158,6 +292,17 @@ class DataClassification:
     """
     Classifies the data to subtypes.
     """
+    def classify_subtype(self, esr1, pgr, erbb2):
+        if esr1 == 'Positive' and pgr == 'Positive' and erbb2 == 'Negative':
+            return 'Luminal A'
+        elif (esr1 == 'Positive' or pgr == 'Positive') and erbb2 == 'Positive':
+            return 'Luminal B'
+        elif esr1 == 'Negative' and pgr == 'Negative' and erbb2 == 'Positive':
+            return 'HER2-enriched'
+        elif esr1 == 'Negative' and pgr == 'Negative' and erbb2 == 'Negative':
+            return 'Triple Negative'
+        return None
+
     def subtypes_classification(self, filtered_data):
         subtype_patients = []
 
@@ -168,51 +313,51 @@ class DataClassification:
             if not all(marker in gene_map for marker in ['ESR1', 'PGR', 'ERBB2']):
                 continue
 
-            esr1 = gene_map['ESR1']
-            pgr = gene_map['PGR']
-            erbb2 = gene_map['ERBB2']
-
-            if esr1 == 'Positive' and pgr == 'Positive' and erbb2 == 'Negative':
-                subtype = 'Luminal A'
-            elif (esr1 == 'Positive' or pgr == 'Positive') and erbb2 == 'Positive':
-                subtype = 'Luminal B'
-            elif esr1 == 'Negative' and pgr == 'Negative' and erbb2 == 'Positive':
-                subtype = 'HER2-enriched'
-            elif esr1 == 'Negative' and pgr == 'Negative' and erbb2 == 'Negative':
-                subtype = 'Triple Negative'
-            else:
+            subtype = self.classify_subtype(gene_map['ESR1'], gene_map['PGR'], gene_map['ERBB2'])
+            if subtype is None:
                 continue
 
             subtype_patients.append({'Patient': submitter_id, 'Subtype': subtype})
 
-        return subtype_patients 
-        
-    
+        return subtype_patients
+
 
 class DataCreator:
     """
     Generates the data and export to CSV format.
     """
-    def __init__(self, file_path):
-        with open(file_path, "r") as f:
-            data = json.load(f)
+    # Patient fields the exports read, other sub-trees of a case are never decoded
+    EXPORT_FIELDS = DataFilter.REQUIRED_FIELDS | {'demographic.gender', 'demographic.age'}
 
-        self.data = data
-        self.data_mapper = DataMapper()
+    def __init__(self, file_path, fields=None):
+        """
+        file_path: raw JSON file, or an iterable of raw case dicts (e.g. GDCCasesDownloader.iter_cases()).
+        fields: patient fields to materialize, defaults to EXPORT_FIELDS, 'all' maps everything.
+        """
+        self.data_mapper = DataMapper(self.EXPORT_FIELDS if fields is None else fields)
         self.data_filter = DataFilter()
         self.data_classification = DataClassification()
 
-    def export_data_to_csv(self, filepath):
-        
-        list_patients = self.get_all_patients_data()
-        #fetch filtered data
-        filtered_data = self.data_filter.get_molecular_gene_result_filtered(list_patients)
-        #classify and fetch filtered data
-        subtype_data = self.data_classification.subtypes_classification(filtered_data)
+        # Cases are mapped while the reader thread (or the downloader) is still producing the rest
+        if isinstance(file_path, (str, os.PathLike)):
+            cases = JsonStreamReader(file_path, keys=self.data_mapper.raw_keys())
+        else:
+            cases = file_path
+        self.patients = [self.data_mapper.map_patient_data(data) for data in cases]
+
+    def export_data_to_csv(self, filepath, compression=None, list_patients=None):
+        """
+        Export the classified ESR1/PGR/ERBB2 rows to CSV, compressed when compression is given
+        ('gzip', 'bz2', 'xz', 'zstd') or the file name ends with a matching extension.
+        Returns the number of exported rows.
+        """
         
-        subtype_map = {entry['Patient']: entry['Subtype'] for entry in subtype_data}
+        if list_patients is None:
+            list_patients = self.get_all_patients_data()
+        subtype_map = self.classify_patients(list_patients)
 
         rows = []
+        summary = DatasetSummary()
         for patient in list_patients:
             
             #skip patients that can't be classified
@@ -241,26 +386,427 @@ class DataCreator:
             }
 
             rows.append(row)
+            summary.add(row)
 
         # CSV Data columns
         fieldnames = ["patient_id", "gender", "age", "ESR1", "PGR", "ERBB2", "subtype"]
 
         # Export CSV
-        with open(filepath, mode='w', newline='', encoding='utf-8') as f:
+        with CompressedFileHandler().open_write(filepath, compression) as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
             writer.writerows(rows)
+        summary.save(DatasetSummary.path_for(filepath))
 
         print(f"Exported {len(rows)} records to: {filepath}")
+        return len(rows)
+
+    def export_partitions(self, directory, partition_key='project_id', compression=None):
+        """
+        Export one filtered CSV per value of partition_key (e.g. per TCGA/CPTAC project) to
+        directory/<value>/filtered_data.csv. Partitions without classified rows are left out.
+        Returns {partition value: csv path}.
+        """
+        partitions = {}
+        for patient in self.get_all_patients_data():
+            value = str(self.data_mapper.get_field(patient, partition_key))
+            partitions.setdefault(value, []).append(patient)
+
+        partition_files = {}
+        for value, list_patients in sorted(partitions.items()):
+            folder = os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]', '_', value))
+            os.makedirs(folder, exist_ok=True)
+            filepath = os.path.join(folder, "filtered_data.csv")
+            if self.export_data_to_csv(filepath, compression, list_patients):
+                partition_files[value] = filepath
+        return partition_files
     
-    def get_all_patients_data(self):
-        list_patients = []
+    def classify_patients(self, list_patients):
+        """
+        Returns {submitter_id: subtype} from each patient's own ESR1/PGR/ERBB2 results.
+        """
+        #fetch filtered data
+        filtered_data = self.data_filter.get_molecular_gene_result_filtered(list_patients)
+        #classify and fetch filtered data
+        subtype_data = self.data_classification.subtypes_classification(filtered_data)
+        return {entry['Patient']: entry['Subtype'] for entry in subtype_data}
+
+    def export_gene_matrix(self, filepath, gene_panel='all'):
+        """
+        Export the classified patients with a configurable gene panel as a sparse .npz file.
+        gene_panel can be a single gene, a list of genes or 'all' for every gene seen.
+        Subtypes always come from ESR1/PGR/ERBB2, the panel only selects the feature columns.
+        """
+        list_patients = self.get_all_patients_data()
+        subtype_map = self.classify_patients(list_patients)
+
+        # Classified patients without a result in the panel stay in as all-missing rows
+        classified_patients = [patient for patient in list_patients if patient.submitter_id in subtype_map]
+        classified = self.data_filter.build_gene_status_matrix(classified_patients, gene_panel, keep_empty=True)
 
-        for data in self.data:
-            patient = self.data_mapper.map_patient_data(data)
-            list_patients.append(patient)
-        return list_patients  
+        demographics = {patient.submitter_id: patient.demographic for patient in classified_patients}
+        patient_ids = classified.patient_ids
+        classified.gender = [str(demographics[pid].gender).upper() for pid in patient_ids]
+        classified.age = [str(demographics[pid].age).upper() for pid in patient_ids]
+        classified.subtype = [str(subtype_map[pid]).upper() for pid in patient_ids]
 
-   
+        GeneMatrixStore().save(classified, filepath)
+        print(f"Exported {len(patient_ids)} records x {len(classified.genes)} genes "
+              f"({classified.matrix.nnz} results) to: {filepath}")
     
-    
\ No newline at end of file
+    def get_all_patients_data(self):
+        return self.patients
+
+
+class GeneMatrixStore:
+    """
+    Saves and loads a GeneStatusMatrix as a compressed .npz file (CSR arrays plus row labels).
+    """
+
+    def save(self, gene_matrix, filepath):
+        matrix = gene_matrix.matrix.tocsr()
+        np.savez_compressed(
+            filepath,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            shape=np.array(matrix.shape),
+            genes=np.array(gene_matrix.genes, dtype=str),
+            patient_id=np.array(gene_matrix.patient_ids, dtype=str),
+            gender=np.array(gene_matrix.gender or [], dtype=str),
+            age=np.array(gene_matrix.age or [], dtype=str),
+            subtype=np.array(gene_matrix.subtype or [], dtype=str)
+        )
+
+    def load(self, filepath):
+        with np.load(filepath) as f:
+            matrix = sparse.csr_matrix(
+                (f['data'], f['indices'], f['indptr']), shape=tuple(f['shape'])
+            )
+            gene_matrix = GeneStatusMatrix(f['patient_id'].tolist(), f['genes'].tolist(), matrix)
+            gene_matrix.gender = f['gender'].tolist()
+            gene_matrix.age = f['age'].tolist()
+            gene_matrix.subtype = f['subtype'].tolist()
+        return gene_matrix
+
+
+class CompressedFileHandler:
+    """
+    Detects compressed files by their magic bytes and opens them as streams.
+    """
+    MAGIC_BYTES = {
+        'gzip': b'\x1f\x8b',
+        'bz2': b'BZh',
+        'xz': b'\xfd7zXZ\x00',
+        'zstd': b'\x28\xb5\x2f\xfd'
+    }
+    EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+
+    def detect(self, file_path):
+        """
+        Returns the compression of a file ('gzip', 'bz2', 'xz', 'zstd') or None for plain files.
+        """
+        with open(file_path, "rb") as f:
+            header = f.read(6)
+        for compression, magic in self.MAGIC_BYTES.items():
+            if header.startswith(magic):
+                return compression
+        return None
+
+    def open_read(self, file_path):
+        """
+        Opens a plain or compressed file as a binary stream that decompresses while it is read.
+        """
+        compression = self.detect(file_path)
+        if compression == 'gzip':
+            return gzip.open(file_path, "rb")
+        if compression == 'bz2':
+            return bz2.open(file_path, "rb")
+        if compression == 'xz':
+            return lzma.open(file_path, "rb")
+        if compression == 'zstd':
+            return self.zstandard().open(file_path, "rb")
+        return open(file_path, "rb")
+
+    def open_write(self, file_path, compression=None):
+        """
+        Opens a text stream for writing, compression defaults to the one matching the file extension.
+        """
+        if compression is None:
+            compression = next(
+                (name for ext, name in self.EXTENSIONS.items() if str(file_path).endswith(ext)), None
+            )
+        text_args = {"encoding": "utf-8", "newline": ""}
+        if compression == 'gzip':
+            return gzip.open(file_path, "wt", **text_args)
+        if compression == 'bz2':
+            return bz2.open(file_path, "wt", **text_args)
+        if compression == 'xz':
+            return lzma.open(file_path, "wt", **text_args)
+        if compression == 'zstd':
+            return self.zstandard().open(file_path, "wt", **text_args)
+        if compression is not None:
+            raise ValueError(f"Unsupported compression '{compression}'.")
+        return open(file_path, "w", **text_args)
+
+    def zstandard(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Reading or writing zstd files requires the 'zstandard' package.")
+        return zstandard
+
+
+class JsonStreamReader:
+    """
+    Iterates the elements of a top-level JSON array without loading the whole document.
+    A background thread reads (and decompresses) chunks while the caller parses and maps them.
+    When keys is given, only those keys of each element object are decoded, the values of all
+    other keys are skipped using a bracket index of the buffer, without building them.
+    """
+    CHUNK_SIZE = 1 << 20
+    WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+    def __init__(self, file_path, keys=None, max_pending_chunks=8):
+        self.file_path = file_path
+        self.keys = None if keys is None else set(keys)
+        self.max_pending_chunks = max_pending_chunks
+        self.decoder = json.JSONDecoder()
+        self.indexed_buffer = None
+        self.open_positions = None
+        self.close_positions = None
+
+    def index_brackets(self, buffer):
+        """
+        Pairs every bracket outside of strings with its closing bracket, vectorized over the buffer.
+        Brackets at the same nesting level alternate open/close in position order, so sorting
+        them by (level, position) puts each pair next to each other.
+        """
+        codes = np.frombuffer(buffer.encode('utf-32-le'), dtype=np.uint32)
+        # Quotes, backslashes and brackets ('[' | 32 == '{', ']' | 32 == '}')
+        special = np.flatnonzero((codes == 34) | (codes == 92) | ((codes | 32) == 123) | ((codes | 32) == 125))
+        chars = codes[special]
+        k = np.arange(len(special))
+
+        # A quote is escaped when an odd number of backslashes directly precedes it
+        is_backslash = chars == 92
+        after_backslash = np.concatenate(([False], is_backslash[:-1] & (special[:-1] + 1 == special[1:])))
+        run_start = np.maximum.accumulate(np.where(is_backslash & ~after_backslash, k, 0))
+        run_length = np.where(after_backslash, k - np.concatenate(([0], run_start[:-1])), 0)
+        quotes = (chars == 34) & (run_length % 2 == 0)
+        in_string = np.cumsum(quotes) % 2 == 1
+
+        brackets = ~is_backslash & (chars != 34) & ~in_string
+        positions = special[brackets]
+        is_open = (chars[brackets] | 32) == 123
+        depth = np.cumsum(np.where(is_open, 1, -1))
+        level = np.where(is_open, depth, depth + 1)
+
+        order = np.lexsort((positions, level))
+        positions, is_open, level = positions[order], is_open[order], level[order]
+        pairs = is_open[:-1] & ~is_open[1:] & (level[:-1] == level[1:])
+        open_positions = positions[:-1][pairs]
+        close_positions = positions[1:][pairs]
+        order = np.argsort(open_positions)
+
+        self.indexed_buffer = buffer
+        self.open_positions = open_positions[order]
+        self.close_positions = close_positions[order]
+
+    def skip_value(self, buffer, pos):
+        """
+        Returns the end position of the value at pos without building it.
+        """
+        if buffer[pos] not in '[{':
+            return self.decoder.raw_decode(buffer, pos)[1]
+
+        if self.indexed_buffer is not buffer:
+            self.index_brackets(buffer)
+        i = np.searchsorted(self.open_positions, pos)
+        if i == len(self.open_positions) or self.open_positions[i] != pos:
+            raise IndexError("Value continues past the buffer.")
+        return int(self.close_positions[i]) + 1
+
+    def decode_object(self, buffer, pos):
+        """
+        Decodes the object at pos keeping only self.keys, returns (object, end position).
+        """
+        result = {}
+        pos = self.WHITESPACE.match(buffer, pos + 1).end()
+        if buffer[pos] == '}':
+            return result, pos + 1
+
+        while True:
+            key, pos = self.decoder.raw_decode(buffer, pos)
+            pos = self.WHITESPACE.match(buffer, pos).end()
+            if buffer[pos] != ':':
+                raise json.JSONDecodeError("Expecting ':' delimiter", buffer, pos)
+            pos = self.WHITESPACE.match(buffer, pos + 1).end()
+
+            if key in self.keys:
+                result[key], pos = self.decoder.raw_decode(buffer, pos)
+            else:
+                pos = self.skip_value(buffer, pos)
+
+            pos = self.WHITESPACE.match(buffer, pos).end()
+            if buffer[pos] == '}':
+                return result, pos + 1
+            if buffer[pos] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos = self.WHITESPACE.match(buffer, pos + 1).end()
+
+    def decode_element(self, buffer, pos):
+        if self.keys is not None and buffer[pos] == '{':
+            return self.decode_object(buffer, pos)
+        return self.decoder.raw_decode(buffer, pos)
+
+    def read_chunks(self, chunks):
+        try:
+            with CompressedFileHandler().open_read(self.file_path) as f:
+                while True:
+                    chunk = f.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    chunks.put(chunk)
+        except Exception as e:
+            chunks.put(e)
+        chunks.put(None)
+
+    def __iter__(self):
+        chunks = queue.Queue(maxsize=self.max_pending_chunks)
+        threading.Thread(target=self.read_chunks, args=(chunks,), daemon=True).start()
+
+        text = codecs.getincrementaldecoder("utf-8-sig")()
+        buffer = ""
+        pos = 0
+        eof = False
+        in_array = None
+
+        def more():
+            nonlocal buffer, pos, eof
+            chunk = chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if chunk is None:
+                eof = True
+                buffer = buffer[pos:] + text.decode(b"", final=True)
+            else:
+                buffer = buffer[pos:] + text.decode(chunk)
+            pos = 0
+
+        while True:
+            # Skip whitespace and separators between elements
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    break
+                more()
+                continue
+
+            if in_array is None:
+                in_array = buffer[pos] == "["
+                if in_array:
+                    pos += 1
+                    continue
+            elif in_array and buffer[pos] == "]":
+                break
+
+            try:
+                element, end = self.decode_element(buffer, pos)
+            except json.JSONDecodeError:
+                # Element continues in the next chunk
+                if eof:
+                    raise
+                more()
+                continue
+            except IndexError:
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of JSON data", buffer, len(buffer))
+                more()
+                continue
+
+            # A non-array document (single case or empty object) is the only element
+            if not in_array:
+                if isinstance(element, list):
+                    yield from element
+                else:
+                    yield element
+                break
+            pos = end
+            yield element
+
+
+class DatasetSummary:
+    """
+    Streaming aggregates of the exported rows, so the distribution plots don't rescan the dataset.
+    Ages are counted per exact value, which keeps any histogram binning possible.
+    """
+    FEATURES = ['gender', 'ESR1', 'PGR', 'ERBB2']
+
+    def __init__(self):
+        self.rows = 0
+        self.subtype_counts = {}
+        self.feature_counts = {feature: {} for feature in self.FEATURES}
+        self.age_counts = {}
+        self.crosstabs = {feature: {} for feature in self.FEATURES}
+
+    @staticmethod
+    def path_for(csv_path):
+        return str(csv_path) + ".summary.json"
+
+    def add(self, row):
+        subtype = row["subtype"]
+        self.rows += 1
+        self.subtype_counts[subtype] = self.subtype_counts.get(subtype, 0) + 1
+
+        ages = self.age_counts.setdefault(subtype, {})
+        ages[row["age"]] = ages.get(row["age"], 0) + 1
+
+        for feature in self.FEATURES:
+            value = row[feature]
+            counts = self.feature_counts[feature]
+            counts[value] = counts.get(value, 0) + 1
+            by_subtype = self.crosstabs[feature].setdefault(subtype, {})
+            by_subtype[value] = by_subtype.get(value, 0) + 1
+
+    def age_histogram(self, subtype=None):
+        """
+        Returns (ages, counts) over all subtypes or one subtype, non numeric ages are left out.
+        """
+        totals = {}
+        for name, ages in self.age_counts.items():
+            if subtype is not None and name != subtype:
+                continue
+            for age, count in ages.items():
+                try:
+                    age = float(age)
+                except ValueError:
+                    continue
+                totals[age] = totals.get(age, 0) + count
+        ages = sorted(totals)
+        return ages, [totals[age] for age in ages]
+
+    def save(self, filepath):
+        summary = {
+            "rows": self.rows,
+            "subtype_counts": self.subtype_counts,
+            "feature_counts": self.feature_counts,
+            "age_counts": self.age_counts,
+            "crosstabs": self.crosstabs
+        }
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        summary = cls()
+        summary.rows = data["rows"]
+        summary.subtype_counts = data["subtype_counts"]
+        summary.feature_counts = data["feature_counts"]
+        summary.age_counts = data["age_counts"]
+        summary.crosstabs = data["crosstabs"]
+        return summary
+
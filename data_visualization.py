@@ -4,24 +4,53 @@ import seaborn as sns
 from sklearn.metrics import ConfusionMatrixDisplay
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import LabelEncoder
+import os
+from data_services import CompressedFileHandler, DatasetSummary
 
 
 
 class DataVisualizer:
     def __init__(self, file_path=None, ml_service=None):
+        self.file_path = file_path
+        self.summary = None
+        self._df = None
+
         if ml_service:
-            self.df = ml_service.df.copy()
+            self._df = ml_service.df.copy()
         elif file_path:
-            self.df = pd.read_csv(file_path)
+            # Distribution plots use the export summary, the raw CSV is only read for ad-hoc plots
+            summary_path = DatasetSummary.path_for(file_path)
+            if os.path.exists(summary_path) and os.path.getmtime(summary_path) >= os.path.getmtime(file_path):
+                self.summary = DatasetSummary.load(summary_path)
         else:
             raise ValueError("Provide either a file_path or an ml_service instance.")
 
+    @property
+    def df(self):
+        if self._df is None:
+            # Plain or compressed (gzip/bz2/xz/zstd) CSV
+            with CompressedFileHandler().open_read(self.file_path) as f:
+                self._df = pd.read_csv(f)
+        return self._df
+
+    def counts(self, feature):
+        """
+        Value counts of a column, from the summary when available.
+        """
+        if self.summary is None:
+            return self.df[feature].value_counts()
+        if feature == 'subtype':
+            counts = self.summary.subtype_counts
+        else:
+            counts = self.summary.feature_counts[feature]
+        return pd.Series(counts).sort_values(ascending=False, kind='stable')
+
     
     #Clinical Data Visuals
     # ----------------------------
     def plot_class_distribution(self):
         plt.figure()
-        self.df['subtype'].value_counts().plot(kind='bar', color='purple')
+        self.counts('subtype').plot(kind='bar', color='purple')
         plt.title("Subtype Distribution")
         plt.xlabel("Subtype")
         plt.ylabel("Count")
@@ -33,7 +62,7 @@ class DataVisualizer:
     def plot_feature_distributions(self):
         for feature in ['gender', 'ESR1', 'PGR', 'ERBB2']:
             plt.figure()
-            self.df[feature].value_counts().plot(kind='bar', color='skyblue')
+            self.counts(feature).plot(kind='bar', color='skyblue')
             plt.title(f"{feature} Distribution")
             plt.xlabel(feature)
             plt.ylabel("Count")
@@ -43,7 +72,11 @@ class DataVisualizer:
 
     def plot_age_distribution(self):
         plt.figure()
-        plt.hist(self.df['age'], bins=20, color='orange', edgecolor='black')
+        if self.summary is not None:
+            ages, counts = self.summary.age_histogram()
+            plt.hist(ages, bins=20, weights=counts, color='orange', edgecolor='black')
+        else:
+            plt.hist(self.df['age'], bins=20, color='orange', edgecolor='black')
         plt.title("Age Distribution")
         plt.xlabel("Age")
         plt.ylabel("Number of Patients")
@@ -51,6 +84,21 @@ class DataVisualizer:
         plt.tight_layout()
         plt.show()
 
+    def plot_feature_by_subtype(self, feature):
+        if self.summary is not None:
+            crosstab = pd.DataFrame(self.summary.crosstabs[feature]).T.fillna(0)
+        else:
+            crosstab = pd.crosstab(self.df['subtype'], self.df[feature])
+        plt.figure()
+        crosstab.plot(kind='bar', stacked=True, ax=plt.gca())
+        plt.title(f"{feature} Status by Subtype")
+        plt.xlabel("Subtype")
+        plt.ylabel("Count")
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+        plt.grid()
+        plt.show()
+
     def plot_feature_vs_age(self, feature):
         if feature not in self.df.columns:
             print(f"Feature '{feature}' not found.")
@@ -76,7 +124,10 @@ class DataVisualizer:
     
     # Model Evaluation Visuals
    
-    def plot_model_scores(self, scores_dict):
+    def plot_model_scores(self, scores_dict, intervals=None):
+        """
+        intervals: optional {model: (low, high)} confidence intervals drawn as error bars.
+        """
         if not scores_dict:
             print("No scores provided.")
             return
@@ -84,6 +135,11 @@ class DataVisualizer:
         scores = list(scores_dict.values())
         plt.figure()
         sns.barplot(x=scores, y=names, palette='viridis')
+        if intervals:
+            # A percentile interval can exclude its estimate, matplotlib rejects negative error lengths
+            lows = [max(0, scores_dict[name] - intervals[name][0]) for name in names]
+            highs = [max(0, intervals[name][1] - scores_dict[name]) for name in names]
+            plt.errorbar(scores, range(len(names)), xerr=[lows, highs], fmt='none', ecolor='black', capsize=4)
         plt.xlabel("F1 Score (weighted)")
         plt.title("Model Performance Comparison")
         plt.xlim(0, 1.05)
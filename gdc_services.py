@@ -0,0 +1,260 @@
+import json
+import os
+import hashlib
+import http.client
+import queue
+import random
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from data_services import DataMapper
+
+"""
+GDC Services for downloading the raw clinical cases.
+
+This module pulls the cases DataCreator ingests from a GDC-style paginated cases endpoint
+(e.g. https://api.gdc.cancer.gov/cases), so datasets/data.json no longer has to be downloaded by hand.
+
+Components:
+- HTTPConnectionPool: Keeps persistent HTTP(S) connections to one host and hands them out to worker threads.
+- PageCache: Stores every downloaded page on disk, so an interrupted download resumes where it stopped.
+- GDCCasesDownloader: Fetches pages concurrently with retries and yields the cases in page order.
+
+Usage:
+    downloader = GDCCasesDownloader("https://api.gdc.cancer.gov/cases", cache_dir="datasets/gdc_cache/")
+    data_creator = DataCreator(downloader.iter_cases())
+
+"""
+
+class HTTPConnectionPool:
+    """
+    Pool of keep-alive connections to the host of base_url, at most maxsize are kept idle.
+    """
+    def __init__(self, base_url, maxsize=8, timeout=30):
+        url = urlsplit(base_url)
+        if url.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme '{url.scheme}'.")
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize)
+
+    def new_connection(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout,
+                                               context=ssl.create_default_context())
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, headers=None):
+        """
+        Sends one request and returns (status, headers, body). Connections that fail are closed, not reused.
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self.new_connection()
+
+        try:
+            connection.request(method, path, headers=headers or {})
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self.idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        return response.status, response.headers, body
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class PageCache:
+    """
+    One JSON file per downloaded page, in a directory per query so different queries never mix.
+    """
+    def __init__(self, cache_dir, query):
+        key = hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()[:16]
+        self.directory = os.path.join(cache_dir, key)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "query.json"), 'w', encoding='utf-8') as f:
+            json.dump(query, f, indent=2, sort_keys=True)
+
+    def path_for(self, offset):
+        return os.path.join(self.directory, f"page-{offset:08d}.json")
+
+    def load(self, offset):
+        """
+        Returns the cached page at offset, or None when it was not downloaded (completely) yet.
+        """
+        try:
+            with open(self.path_for(offset), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self, offset, page):
+        # Written next to the target and renamed, so a crash never leaves a half-written page behind
+        path = self.path_for(offset)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(page, f)
+        os.replace(tmp_path, path)
+
+
+class GDCCasesDownloader:
+    """
+    Downloads the cases of a GDC-style paginated cases endpoint with the sub-trees DataMapper reads.
+    At most max_workers pages are requested at the same time, failed requests are retried with
+    exponential backoff and every page is cached in cache_dir.
+    """
+    # GDC fields and expansions that hold each top-level case key read by DataMapper
+    RAW_KEY_FIELDS = {
+        'submitter_id': (['submitter_id'], []),
+        'project': (['project.project_id'], []),
+        'disease_type': (['disease_type'], []),
+        'consent_type': (['consent_type'], []),
+        'demographic': ([], ['demographic']),
+        'diagnoses': ([], ['diagnoses', 'diagnoses.treatments']),
+        'follow_ups': ([], ['follow_ups', 'follow_ups.molecular_tests'])
+    }
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, endpoint, fields=None, filters=None, page_size=100, max_workers=4, cache_dir=None,
+                 max_retries=5, backoff=0.5, max_backoff=30, timeout=60):
+        """
+        fields: patient fields the cases are mapped to (see DataMapper), defaults to every field.
+        filters: GDC filters, e.g. {"op": "in", "content": {"field": "project.project_id", "value": ["TCGA-BRCA"]}}.
+        """
+        url = urlsplit(endpoint)
+        self.path = url.path or '/'
+        self.pool = HTTPConnectionPool(endpoint, maxsize=max_workers, timeout=timeout)
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        request_fields, expand = [], []
+        for key in sorted(DataMapper(fields).raw_keys()):
+            request_fields += self.RAW_KEY_FIELDS[key][0]
+            expand += self.RAW_KEY_FIELDS[key][1]
+        self.query = {'format': 'json', 'size': page_size}
+        if request_fields:
+            self.query['fields'] = ','.join(request_fields)
+        if expand:
+            self.query['expand'] = ','.join(expand)
+        if filters:
+            self.query['filters'] = json.dumps(filters, sort_keys=True)
+
+        cache_query = dict(self.query, endpoint=f"{url.scheme}://{url.netloc}{self.path}")
+        self.cache = PageCache(cache_dir, cache_query) if cache_dir else None
+        # get_page runs on the worker threads, the page counters are shared between them
+        self.counter_lock = threading.Lock()
+        self.downloaded_pages = 0
+        self.cached_pages = 0
+
+    def fetch(self, offset):
+        """
+        Requests the page starting at case offset, retrying failed attempts. Returns GDC's "data" object.
+        """
+        path = f"{self.path}?{urlencode(dict(self.query, **{'from': offset}))}"
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay(attempt, error))
+            try:
+                status, headers, body = self.pool.request('GET', path, {'Accept': 'application/json'})
+                if status in self.RETRY_STATUS:
+                    error = RetryableStatus(status, headers.get('Retry-After'))
+                    continue
+                if status != 200:
+                    raise RuntimeError(f"GDC request {path} failed with HTTP {status}: {body[:200]!r}")
+                return json.loads(body)['data']
+            except (OSError, http.client.HTTPException, json.JSONDecodeError, UnicodeDecodeError) as e:
+                error = e
+        raise RuntimeError(f"GDC request {path} failed after {self.max_retries + 1} attempts: {error}") from error
+
+    def retry_delay(self, attempt, error):
+        # Retry-After from the server wins, otherwise exponential backoff with full jitter
+        if isinstance(error, RetryableStatus) and error.retry_after is not None:
+            return min(error.retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def get_page(self, offset):
+        if self.cache is not None:
+            page = self.cache.load(offset)
+            if page is not None:
+                with self.counter_lock:
+                    self.cached_pages += 1
+                return page
+        page = self.fetch(offset)
+        if self.cache is not None:
+            self.cache.save(offset, page)
+        with self.counter_lock:
+            self.downloaded_pages += 1
+        return page
+
+    def iter_pages(self):
+        """
+        Yields the pages in order while up to max_workers later pages are downloading.
+        """
+        first = self.get_page(0)
+        yield first
+        total = first['pagination']['total']
+        offsets = iter(range(self.page_size, total, self.page_size))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # A bounded window of pending pages keeps memory flat when ingestion is slower than the network
+            pending = queue.SimpleQueue()
+            for offset in offsets:
+                pending.put(executor.submit(self.get_page, offset))
+                if pending.qsize() >= self.max_workers * 2:
+                    break
+            try:
+                while not pending.empty():
+                    page = pending.get().result()
+                    next_offset = next(offsets, None)
+                    if next_offset is not None:
+                        pending.put(executor.submit(self.get_page, next_offset))
+                    yield page
+            finally:
+                while not pending.empty():
+                    pending.get().cancel()
+
+    def iter_cases(self):
+        """
+        Yields the raw case dicts, ready for DataCreator.
+        """
+        try:
+            for page in self.iter_pages():
+                yield from page['hits']
+        finally:
+            self.pool.close()
+        print(f"GDC download COMPLETED! ({self.downloaded_pages} pages downloaded, {self.cached_pages} from cache)")
+
+
+class RetryableStatus(Exception):
+    """
+    HTTP status that is worth retrying, with the server's Retry-After seconds if given.
+    """
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        try:
+            self.retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            self.retry_after = None
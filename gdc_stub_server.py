@@ -0,0 +1,175 @@
+import sys
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+"""
+Local stub of the GDC cases endpoint for testing GDCCasesDownloader without network access.
+
+Serves deterministic synthetic breast cancer cases in GDC's paginated response format, with
+injected latency and failures (HTTP 503 / 429 and connections dropped mid-response).
+
+Components:
+- GDCStubServer: Runs the stub in a background thread, usable as a context manager.
+
+Usage:
+    python gdc_stub_server.py 8765
+    (then point GDCCasesDownloader at http://127.0.0.1:8765/cases)
+
+"""
+
+class GDCStubServer:
+    """
+    Serves n_cases synthetic cases at /cases. Every request waits latency seconds (plus up to
+    latency_jitter) and fails with probability failure_rate.
+    """
+    GENES = ['ESR1', 'PGR', 'ERBB2', 'MKI67', 'TP53', 'GATA3']
+    TEST_RESULTS = ['Positive', 'Negative', 'Positive', 'Negative', 'Equivocal']
+
+    def __init__(self, n_cases=1000, latency=0.05, latency_jitter=0.05, failure_rate=0.1, seed=0,
+                 host='127.0.0.1', port=0):
+        self.cases = self.synthetic_cases(n_cases, seed)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/cases"
+
+    def synthetic_cases(self, n_cases, seed):
+        rng = random.Random(seed)
+        cases = []
+        for i in range(n_cases):
+            tests = [
+                {"gene_symbol": gene, "test_result": rng.choice(self.TEST_RESULTS), "molecular_analysis_method": "IHC"}
+                for gene in self.GENES if rng.random() < 0.9
+            ]
+            cases.append({
+                "id": f"stub-{i:06d}",
+                "submitter_id": f"STUB-{i:04d}",
+                "disease_type": "Ductal and Lobular Neoplasms",
+                "consent_type": "Informed Consent",
+                "project": {"project_id": rng.choice(["TCGA-BRCA", "CPTAC-2"])},
+                "demographic": {"gender": rng.choice(["female", "female", "male"]), "age_at_index": rng.randint(25, 90),
+                                "race": "white", "vital_status": rng.choice(["Alive", "Dead"])},
+                "diagnoses": [{"submitter_id": f"STUB-{i:04d}_diagnosis", "primary_diagnosis": "Infiltrating duct carcinoma, NOS",
+                               "treatments": [{"treatment_type": rng.choice(["Chemotherapy", "Radiation Therapy, NOS"]),
+                                               "treatment_or_therapy": rng.choice(["yes", "no"])}]}],
+                "follow_ups": [{"molecular_tests": tests[:3]}, {"molecular_tests": tests[3:]}]
+            })
+        return cases
+
+    def project(self, case, fields, expand):
+        """
+        Keeps the requested fields and expanded sub-trees of a case, like GDC does.
+        """
+        result = {"id": case["id"]}
+        for field in fields:
+            key = field.split('.')[0]
+            if key in case:
+                result[key] = case[key]
+        for path in expand:
+            key = path.split('.')[0]
+            if key in case:
+                result[key] = case[key]
+        return result
+
+    def page(self, query):
+        size = int(query.get('size', ['10'])[0])
+        offset = int(query.get('from', ['0'])[0])
+        fields = [f for f in query.get('fields', [''])[0].split(',') if f]
+        expand = [e for e in query.get('expand', [''])[0].split(',') if e]
+        hits = [self.project(case, fields, expand) for case in self.cases[offset:offset + size]]
+        total = len(self.cases)
+        return {
+            "data": {
+                "hits": hits,
+                "pagination": {"count": len(hits), "total": total, "size": size, "from": offset,
+                               "page": offset // size + 1, "pages": -(-total // size)}
+            },
+            "warnings": {}
+        }
+
+    def handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                with stub.lock:
+                    stub.requests += 1
+                    delay = stub.latency + stub.random.uniform(0, stub.latency_jitter)
+                    failure = stub.random.choice(['503', '429', 'drop']) if stub.random.random() < stub.failure_rate else None
+                    if failure:
+                        stub.failures += 1
+                time.sleep(delay)
+
+                if url.path != '/cases':
+                    return self.send_body(404, b'{"message": "Not found"}')
+                if failure == '503':
+                    return self.send_body(503, b'{"message": "Service unavailable"}')
+                if failure == '429':
+                    return self.send_body(429, b'{"message": "Too many requests"}', {'Retry-After': '0'})
+
+                body = json.dumps(stub.page(parse_qs(url.query))).encode()
+                if failure == 'drop':
+                    # Announce the full body, send half of it and hang up
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.send_body(200, body)
+
+            def send_body(self, status, body, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    stub = GDCStubServer(port=port)
+    print(f"GDC stub serving {len(stub.cases)} cases at {stub.url}")
+    stub.server.serve_forever()
@@ -1,5 +1,6 @@
 from data_services import DataCreator
-from ml_services import MachineLearningService
+from gdc_services import GDCCasesDownloader
+from ml_services import MachineLearningService, MultiCohortService
 from data_visualization import DataVisualizer
 from menu_controller import MenuController  # <- new script
 
@@ -7,16 +8,54 @@ from menu_controller import MenuController  # <- new script
 root = "datasets/"
 data_json = root + "data.json"
 csv_path = root + "filtered_data.csv"
+gene_matrix_path = root + "gene_matrix.npz"
+model_artifact_path = root + "best_model.npz"
+partitions_dir = root + "partitions/"
+
+# Gene panel for training: None keeps the ESR1/PGR/ERBB2 CSV,
+# a gene or list of genes (e.g. ['ESR1', 'PGR', 'ERBB2', 'MKI67']) or 'all' trains on the sparse gene matrix
+gene_panel = None
+
+# Train on unique (features, label) rows weighted by their counts instead of every patient row
+compress_duplicates = False
+
+# Download the cases from a GDC cases endpoint instead of reading data_json, None reads data_json
+# (e.g. "https://api.gdc.cancer.gov/cases", or the local stub started with `python gdc_stub_server.py 8765`)
+gdc_endpoint = None
+gdc_filters = {"op": "in", "content": {"field": "project.project_id", "value": ["TCGA-BRCA"]}}
+gdc_cache_dir = root + "gdc_cache/"
+
+# Multi-cohort mode: also train one model set per value of this patient field (e.g. 'project_id'), None disables it
+partition_key = None
 
 #Create and export data
-data_creator = DataCreator(data_json)
+fields = DataCreator.EXPORT_FIELDS if partition_key is None else DataCreator.EXPORT_FIELDS | {partition_key}
+if gdc_endpoint is not None:
+    downloader = GDCCasesDownloader(gdc_endpoint, fields=fields, filters=gdc_filters, cache_dir=gdc_cache_dir)
+    data_creator = DataCreator(downloader.iter_cases(), fields=fields)
+else:
+    data_creator = DataCreator(data_json, fields=fields)
 data_creator.export_data_to_csv(csv_path)
+if gene_panel is not None:
+    data_creator.export_gene_matrix(gene_matrix_path, gene_panel)
 
 #Train models
-ml_service = MachineLearningService(csv_path)
+ml_service = MachineLearningService(
+    gene_matrix_path if gene_panel is not None else csv_path, compress_duplicates=compress_duplicates
+)
 ml_service.run()
+ml_service.export_inference_artifact(model_artifact_path)
+
+#Train one model set per partition
+cohort_service = None
+if partition_key is not None:
+    partition_files = data_creator.export_partitions(partitions_dir, partition_key)
+    cohort_service = MultiCohortService(partition_files, partition_key, compress_duplicates=compress_duplicates)
+    cohort_service.run()
+    cohort_service.export_inference_artifacts()
+    cohort_service.display_registry()
 
 #Launch Menu
 visualizer = DataVisualizer(csv_path)
-menu = MenuController(ml_service, visualizer)
+menu = MenuController(ml_service, visualizer, cohort_service)
 menu.main_menu()
@@ -1,7 +1,9 @@
 class MenuController:
-    def __init__(self, ml_service, visualizer):
+    def __init__(self, ml_service, visualizer, cohort_service=None):
         self.ml_service = ml_service
         self.visualizer = visualizer
+        # Optional MultiCohortService, predictions are then routed to the selected partition's model
+        self.cohort_service = cohort_service
 
     def external_input_prompt(self):
         def select_option(prompt, options):
@@ -14,6 +16,14 @@ class MenuController:
                 return None
             return options.get(choice)
 
+        partition = None
+        if self.cohort_service:
+            partitions = self.cohort_service.available_partitions()
+            options = {str(i): p for i, p in enumerate(partitions, start=1)}
+            options[str(len(partitions) + 1)] = 'All data (global model)'
+            partition = select_option(f"Select {self.cohort_service.partition_key}", options)
+            if partition is None: return
+
         gender = select_option("Select Gender", {'1': 'FEMALE', '2': 'MALE'})
         if gender is None: return
 
@@ -42,8 +52,13 @@ class MenuController:
             'ERBB2': erbb2
         }
 
-        print("\n--- Prediction using best model ---")
-        self.ml_service.external_test(input_dict, model_name=self.ml_service.best_model_name)
+        if self.cohort_service and partition in self.cohort_service.available_partitions():
+            input_dict[self.cohort_service.partition_key] = partition
+            print("\n--- Prediction using the best model of " + partition + " ---")
+            self.cohort_service.external_test(input_dict)
+        else:
+            print("\n--- Prediction using best model ---")
+            self.ml_service.external_test(input_dict, model_name=None)
         input("\nPress ENTER to return to main menu...")
 
     def display_model_stats_menu(self):
@@ -53,6 +68,8 @@ class MenuController:
             print("2. Display model performance summary")
             print("3. Display hyperparameter tuning results")
             print("4. Display best model")
+            if self.cohort_service:
+                print("5. Display best model per " + self.cohort_service.partition_key)
             print("0. Back to main menu")
 
             choice = input("Enter your choice: ").strip()
@@ -64,6 +81,8 @@ class MenuController:
                 self.ml_service.display_tuning_results()
             elif choice == '4':
                 self.ml_service.display_best_model()
+            elif choice == '5' and self.cohort_service:
+                self.cohort_service.display_registry()
             elif choice == '0':
                 break
             else:
@@ -82,6 +101,7 @@ class MenuController:
             print("7. Plot Feature Importances (Random Forest)")
             print("8. Plot Confusion Matrix (Best Model)")
             print("9. PCA Projection of Clinical Features")  # 👈 NEW
+            print("10. Plot Feature Status by Subtype")
             print("0. Back to main menu")
 
             choice = input("Enter your choice: ").strip()
@@ -134,25 +154,24 @@ class MenuController:
                     continue
 
                 self.visualizer.plot_grouped_scatter(x, y, group_by='subtype')
-            elif choice == '6':
-                self.visualizer.plot_model_scores(
-                    {k: v['score'] for k, v in self.ml_service.tuned_model_scores.items()}
-                )
-            elif choice == '7':
-                model = self.ml_service.models.get("Random Forest (Tuned)")
-                if model:
-                    self.visualizer.plot_feature_importances(model, self.ml_service.X.columns)
-                else:
-                    print("Random Forest (Tuned) not available.")
-            elif choice == '8':
-                self.visualizer.plot_confusion_matrix(
-                    self.ml_service.best_model,
-                    self.ml_service.X,
-                    self.ml_service.y,
-                    self.ml_service.target.classes_
-                )
+            elif choice in ('6', '7', '8'):
+                # One snapshot per plot, a retraining finishing meanwhile does not mix models
+                with self.ml_service.acquire_snapshot() as snapshot:
+                    self.model_plot(choice, snapshot)
             elif choice == '9':  # 👈 NEW
                 self.visualizer.plot_pca_projection()
+            elif choice == '10':
+                print("\nSelect Feature:")
+                options = {'1': 'gender', '2': 'ESR1', '3': 'PGR', '4': 'ERBB2'}
+                for k, v in options.items():
+                    print(f"{k}. {v}")
+                print("0. Back")
+                selection = input("Enter your choice: ").strip()
+                feature = options.get(selection)
+                if feature:
+                    self.visualizer.plot_feature_by_subtype(feature)
+                elif selection != '0':
+                    print("Invalid choice.")
             elif choice == '0':
                 break
             else:
@@ -160,6 +179,35 @@ class MenuController:
             input("\nPress ENTER to return...")
 
 
+    def model_plot(self, choice, snapshot):
+        if snapshot is None:
+            print("No models have been trained yet.")
+        elif choice == '6':
+            intervals = snapshot.model_intervals
+            if intervals:
+                # Bootstrap F1 of every model with its confidence interval
+                self.visualizer.plot_model_scores(
+                    {k: v['f1_weighted']['estimate'] for k, v in intervals.items()},
+                    {k: (v['f1_weighted']['low'], v['f1_weighted']['high']) for k, v in intervals.items()}
+                )
+            else:
+                self.visualizer.plot_model_scores(
+                    {k: v['score'] for k, v in snapshot.tuned_model_scores.items()}
+                )
+        elif choice == '7':
+            model = snapshot.models.get("Random Forest (Tuned)")
+            if model:
+                self.visualizer.plot_feature_importances(model, snapshot.feature_names)
+            else:
+                print("Random Forest (Tuned) not available.")
+        elif choice == '8':
+            self.visualizer.plot_confusion_matrix(
+                snapshot.best_model,
+                snapshot.X,
+                snapshot.y,
+                snapshot.target.classes_
+            )
+
     def main_menu(self):
         while True:
             print("\n=== MAIN MENU ===")
@@ -168,6 +216,7 @@ class MenuController:
             print("3. Display model stats")
             print("4. Display best model")
             print("5. Data Visualizations")
+            print(f"6. Retrain models in background ({self.ml_service.retraining_status()})")
             print("0. Exit")
 
             choice = input("Enter your choice: ").strip()
@@ -184,6 +233,9 @@ class MenuController:
                 input("\nPress ENTER to return...")
             elif choice == '5':
                 self.data_visualization_menu()
+            elif choice == '6':
+                self.ml_service.retrain_in_background()
+                input("\nPress ENTER to return...")
             elif choice == '0':
                 print("Goodbye!")
                 break
@@ -8,6 +8,14 @@ ML pipeline steps from preprocessing to final predictions.
 """
 #pandas
 import pandas as pd
+import numpy as np
+from scipy import sparse
+
+#sparse gene panel datasets and compressed CSV inputs
+from data_services import GeneMatrixStore, CompressedFileHandler
+
+#compiled artifacts and the KNN voting they share
+from predictor import CompiledPredictor, knn_votes
 
 #preprocessing
 from sklearn.preprocessing import LabelEncoder
@@ -23,44 +31,178 @@ from sklearn.model_selection import train_test_split
 
 #reports and scores
 from sklearn.metrics import classification_report
-from sklearn.model_selection import cross_val_score
 from sklearn.metrics import f1_score
 
 #hyper tuning
-from sklearn.model_selection import GridSearchCV
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import warnings
+import joblib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from types import MappingProxyType
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+from sklearn.utils import _safe_indexing
 
 #plotting graphs
 import matplotlib.pyplot as plt
 
 
 class MachineLearningService:
-    def __init__(self, file_path):
-        self.df = pd.read_csv(file_path)
+    def __init__(self, file_path, tuning_store_path=None, compress_duplicates=False, n_jobs=-1):
+        self.file_path = file_path
+
+        # .npz inputs are sparse gene panel exports (DataCreator.export_gene_matrix)
+        self.gene_matrix = None
+        if str(file_path).endswith('.npz'):
+            self.gene_matrix = GeneMatrixStore().load(file_path)
+            self.df = pd.DataFrame({
+                'patient_id': self.gene_matrix.patient_ids,
+                'gender': self.gene_matrix.gender,
+                'age': pd.to_numeric(self.gene_matrix.age, errors='coerce'),
+                'subtype': self.gene_matrix.subtype
+            })
+        else:
+            with CompressedFileHandler().open_read(file_path) as f:
+                self.df = pd.read_csv(f)
 
         # Preprocessing
         self.label_encoders = {}
+        self.feature_names = None
         self.X = None
         self.y = None
         self.target = None
 
+        # Optional duplicate compression: unique (features, label) rows with their counts
+        self.compress_duplicates = compress_duplicates
+        self.X_unique = None
+        self.y_unique = None
+        self.sample_counts = None
+        self.row_index = None
+
+        # Worker processes for hyperparameter tuning
+        self.n_jobs = n_jobs
+
         # Models and scores
         self.models = None
         self.model_names = {
             "Logistic Regression", "SVC", "Random Forest", "K-Nearest Neighbors"
         }
         self.tuned_model_scores = {}
+        self.tuning_results = {}
+
+        # Cached predictions on the evaluation data and their bootstrap confidence intervals
+        self.predictions = {}
+        self.model_intervals = {}
+
+        # Every (model, params, fold) evaluation is persisted here so tuning can resume
+        if tuning_store_path is None:
+            tuning_store_path = os.path.join(os.path.dirname(str(file_path)), "tuning_results.jsonl")
+        self.tuning_store = TuningResultStore(tuning_store_path)
 
         # State
         self.best_model = None
         self.best_model_name = None
         self.is_trained = False
 
+        # The attributes above are this instance's training workspace, predictions and stats read the
+        # live snapshot, which retraining replaces with one reference flip
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock()
+        self.in_flight = {}
+        self.retired_snapshots = []
+        self.retraining = None
+
+    def __getstate__(self):
+        # Locks and retraining threads stay in the process that owns them (partition services are pickled)
+        state = self.__dict__.copy()
+        state.update(snapshot_lock=None, in_flight={}, retired_snapshots=[], retraining=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.snapshot_lock = threading.Lock()
+
     def run(self):
         self.model_training()
         self.hyperparameter_tuning(self.models)
         self.final_prediction()
+        self.publish_snapshot(ModelSnapshot(self))
         return self.is_trained
 
+    def publish_snapshot(self, snapshot):
+        """
+        Makes snapshot the live one. Requests already running keep the previous snapshot,
+        which is released when the last of them finishes.
+        """
+        with self.snapshot_lock:
+            previous, self.snapshot = self.snapshot, snapshot
+            if previous is not None and self.in_flight.get(id(previous)):
+                self.retired_snapshots.append(previous)
+
+    @contextmanager
+    def acquire_snapshot(self):
+        """
+        Pins the live snapshot (None before the first training) for the duration of one request.
+        """
+        with self.snapshot_lock:
+            snapshot = self.snapshot
+            self.in_flight[id(snapshot)] = self.in_flight.get(id(snapshot), 0) + 1
+        try:
+            yield snapshot
+        finally:
+            with self.snapshot_lock:
+                self.in_flight[id(snapshot)] -= 1
+                if not self.in_flight[id(snapshot)]:
+                    del self.in_flight[id(snapshot)]
+                    self.retired_snapshots = [s for s in self.retired_snapshots if s is not snapshot]
+
+    def retrain_in_background(self, file_path=None):
+        """
+        Retrains on a fresh copy of the data (default: the file this service was built from) in a worker
+        thread, the current snapshot keeps serving predictions until the new one is swapped in.
+        Returns the Future of the retraining.
+        """
+        with self.snapshot_lock:
+            if self.retraining is not None and not self.retraining.done():
+                print("Retraining is already running.")
+                return self.retraining
+            future = self.retraining = Future()
+        print("Retraining started, predictions use the current models until it finishes.")
+
+        def work():
+            future.set_result(self.retrain(file_path or self.file_path))
+
+        # Daemon thread, exiting the application does not wait for a running retraining
+        threading.Thread(target=work, name="retrain", daemon=True).start()
+        return self.retraining
+
+    def retrain(self, file_path):
+        try:
+            # Built off to the side, nothing the live snapshot references is modified
+            trainer = MachineLearningService(file_path, self.tuning_store.file_path, self.compress_duplicates, self.n_jobs)
+            trainer.run()
+        except Exception as e:
+            print(f"Retraining failed, keeping the current models: {e}")
+            return False
+        self.publish_snapshot(trainer.snapshot)
+        print(f"Retrained models are live, best model: {trainer.snapshot.best_model_name}")
+        return True
+
+    def retraining_status(self):
+        if self.retraining is None:
+            return "not started"
+        if not self.retraining.done():
+            return "running"
+        return "completed" if self.retraining.result() else "failed"
+
     def preprocess_data(self):
         print("Preprocessing data...")
         self.df = self.df.drop(columns=['patient_id'])
@@ -76,27 +218,122 @@ class MachineLearningService:
 
         self.X = self.df.drop(columns=['subtype', 'subtype_encoded'])
         self.y = self.df['subtype_encoded']
+        self.feature_names = list(self.X.columns)
         return self.X, self.y, self.target
 
+    def preprocess_sparse_data(self):
+        """
+        Builds a CSR feature matrix [gender, age, gene statuses] without densifying the gene panel.
+        Gene columns keep the export encoding: 1 positive, -1 negative, 0 missing.
+        """
+        print("Preprocessing sparse gene panel data...")
+        self.df = self.df.drop(columns=['patient_id'])
+
+        label_encoder = LabelEncoder()
+        self.df['gender'] = label_encoder.fit_transform(self.df['gender'])
+        self.label_encoders['gender'] = label_encoder
+
+        self.target = LabelEncoder()
+        self.df['subtype_encoded'] = self.target.fit_transform(self.df['subtype'])
+
+        clinical = sparse.csr_matrix(self.df[['gender', 'age']].to_numpy(dtype=np.float64))
+        self.X = sparse.hstack([clinical, self.gene_matrix.matrix.astype(np.float64)], format='csr')
+        self.y = self.df['subtype_encoded']
+        self.feature_names = ['gender', 'age'] + list(self.gene_matrix.genes)
+        return self.X, self.y, self.target
+
+    def encode_input(self, input_dict):
+        """
+        Encodes one external input dict into a single model row of the live snapshot.
+        """
+        with self.acquire_snapshot() as snapshot:
+            return snapshot.encode_input(input_dict)
+
+    def compress_training_data(self):
+        """
+        Groups identical (features, label) rows into unique rows with counts (one representative each).
+        row_index maps every original row to its unique row, so any row subset can be
+        turned into unique rows + sample weights with a bincount.
+        Random forest only matches the uncompressed run in expectation: its bootstrap draws unique rows,
+        so a row's duplicates are always in or out together.
+        """
+        print("Compressing duplicate rows...")
+        y = np.asarray(self.y)
+        if sparse.issparse(self.X):
+            X = self.X.tocsr(copy=True)
+            X.sum_duplicates()
+            X.eliminate_zeros()
+            keys = {}
+            row_index = np.empty(X.shape[0], dtype=np.intp)
+            for i in range(X.shape[0]):
+                start, end = X.indptr[i], X.indptr[i + 1]
+                key = (y[i], X.indices[start:end].tobytes(), X.data[start:end].tobytes())
+                row_index[i] = keys.setdefault(key, len(keys))
+            first_rows = np.zeros(len(keys), dtype=np.intp)
+            first_rows[row_index] = np.arange(X.shape[0])
+        else:
+            rows = np.column_stack([np.asarray(self.X, dtype=np.float64), y])
+            _, first_rows, row_index = np.unique(rows, axis=0, return_index=True, return_inverse=True)
+            row_index = row_index.ravel()
+
+        self.X_unique = _safe_indexing(self.X, first_rows)
+        self.y_unique = y[first_rows]
+        self.sample_counts = np.bincount(row_index, minlength=len(first_rows)).astype(np.float64)
+        self.row_index = row_index
+        print(f"Compressed {len(y)} rows into {len(first_rows)} unique rows.")
+
+    def subset_weights(self, indices):
+        """
+        Returns (unique row indices, counts) for a subset of the original rows.
+        """
+        counts = np.bincount(self.row_index[indices], minlength=len(self.y_unique))
+        unique_rows = np.flatnonzero(counts)
+        return unique_rows, counts[unique_rows].astype(np.float64)
+
+    def evaluation_data(self):
+        """
+        Returns (X, y, sample_weight) for scoring on the full dataset, compressed when enabled.
+        """
+        if self.compress_duplicates:
+            return self.X_unique, self.y_unique, self.sample_counts
+        return self.X, self.y, None
+
     def model_training(self):
         print("Training model started...")
-        self.X, self.y, self.target = self.preprocess_data()
-
-        X_train, X_test, y_train, y_test = train_test_split(
-            self.X, self.y, test_size=0.2, random_state=42
-        )
+        if self.gene_matrix is not None:
+            self.X, self.y, self.target = self.preprocess_sparse_data()
+        else:
+            self.X, self.y, self.target = self.preprocess_data()
 
         self.models = {
             "Logistic Regression": LogisticRegression(max_iter=1000),
             "SVC": SVC(kernel='linear'),
             "Random Forest": RandomForestClassifier(random_state=42),
-            "K-Nearest Neighbors": KNeighborsClassifier()
+            # Order-independent tie breaking, so compressed, uncompressed and compiled KNN agree
+            "K-Nearest Neighbors": CountWeightedKNeighborsClassifier()
         }
 
+        if self.compress_duplicates:
+            self.compress_training_data()
+
+            # Split the original rows, then train on the unique rows of the training part
+            train_rows, test_rows = train_test_split(
+                np.arange(len(self.y)), test_size=0.2, random_state=42
+            )
+            unique_train, train_counts = self.subset_weights(train_rows)
+            X_train = _safe_indexing(self.X_unique, unique_train)
+            y_train = self.y_unique[unique_train]
+            fit_params = {'sample_weight': train_counts}
+        else:
+            X_train, X_test, y_train, y_test = train_test_split(
+                self.X, self.y, test_size=0.2, random_state=42
+            )
+            fit_params = {}
+
+        # Cross-validation happens in hyperparameter_tuning, over folds of the original patient rows
         for name, model in self.models.items():
             print("Training model: " + name + "...")
-            model.fit(X_train, y_train)
-            cross_val_score(model, self.X, self.y, cv=5, scoring='f1_weighted')
+            model.fit(X_train, y_train, **fit_params)
 
     def hyperparameter_tuning(self, models):
         print("Hyperparameter tuning started...")
@@ -123,113 +360,698 @@ class MachineLearningService:
         }
 
         tuned_models = {}
+        cv = StratifiedKFold(n_splits=5)
+        folds = list(cv.split(self.X, self.y))
+        scoring = 'f1_weighted'
+        data_hash = self.tuning_store.data_hash(self.X, self.y, cv, scoring, self.compress_duplicates)
+
+        # With compression each fold becomes unique rows + counts, the folds themselves stay the same
+        if self.compress_duplicates:
+            splits = [self.subset_weights(train) + self.subset_weights(test) for train, test in folds]
+            X_tune, y_tune = self.X_unique, self.y_unique
+        else:
+            splits = [(train, None, test, None) for train, test in folds]
+            X_tune, y_tune = self.X, self.y
 
+        # Collect the missing evaluations of every model first, so one pool runs them all
+        searches = {}
+        tasks = []
         for name, model in models.items():
-            print("Tuning model: " + name + "...")
             if name not in param_grids:
                 continue
+            print("Tuning model: " + name + "...")
 
-            grid_search = GridSearchCV(
-                estimator=model,
-                param_grid=param_grids[name],
-                cv=5,
-                scoring='f1_weighted',
-                n_jobs=-1,
-                verbose=0
-            )
+            estimator_key = repr(clone(model))
+            candidates = list(ParameterGrid(param_grids[name]))
+            finished = self.tuning_store.load(data_hash, name, estimator_key)
+            searches[name] = (model, estimator_key, candidates, finished)
+
+            missing = [
+                (params, fold) for params in candidates for fold in range(len(folds))
+                if (self.tuning_store.params_key(params), fold) not in finished
+            ]
+            print(f"Reusing {len(candidates) * len(folds) - len(missing)} stored fold evaluations, "
+                  f"{len(missing)} to compute...")
+            tasks.extend((name, params, fold) for params, fold in missing)
 
-            grid_search.fit(self.X, self.y)
+        if tasks:
+            with SharedTrainingMatrix(X_tune) as X_shared:
+                y_shared = np.asarray(y_tune)
+                # Results are stored as they arrive so a killed run resumes where it stopped
+                evaluations = Parallel(n_jobs=self.n_jobs, return_as='generator_unordered')(
+                    delayed(evaluate_fold)(name, searches[name][0], params, fold, X_shared, y_shared, splits[fold], scoring)
+                    for name, params, fold in tasks
+                )
+                for name, params, fold, score in evaluations:
+                    model, estimator_key, candidates, finished = searches[name]
+                    self.tuning_store.append(data_hash, name, estimator_key, params, fold, score)
+                    finished[(self.tuning_store.params_key(params), fold)] = score
+
+        for name, (model, estimator_key, candidates, finished) in searches.items():
+            cv_results = []
+            for params in candidates:
+                key = self.tuning_store.params_key(params)
+                fold_scores = [finished[(key, fold)] for fold in range(len(folds))]
+                cv_results.append({
+                    "params": params,
+                    "fold_scores": fold_scores,
+                    "mean_score": float(np.mean(fold_scores))
+                })
+            self.tuning_results[name] = cv_results
+
+            # Same selection as GridSearchCV: highest mean score, first candidate wins ties
+            mean_scores = np.array([result["mean_score"] for result in cv_results])
+            best_index = int(np.argmax(np.nan_to_num(mean_scores, nan=-np.inf)))
+            best_params = cv_results[best_index]["params"]
 
             tuned_name = name + " (Tuned)"
-            tuned_models[tuned_name] = grid_search.best_estimator_
+            X_fit, y_fit, fit_weight = self.evaluation_data()
+            fit_params = {} if fit_weight is None else {'sample_weight': fit_weight}
+            tuned_models[tuned_name] = clone(model).set_params(**best_params).fit(X_fit, y_fit, **fit_params)
             self.tuned_model_scores[tuned_name] = {
-                "params": grid_search.best_params_,
-                "score": grid_search.best_score_
+                "params": best_params,
+                "score": cv_results[best_index]["mean_score"]
             }
 
         self.models.update(tuned_models)
         self.is_trained = True
 
     def final_prediction(self):
-        scores = {}
-        for name, model in self.models.items():
-            y_pred = model.predict(self.X)
-            f1 = f1_score(self.y, y_pred, average='weighted')
-            scores[name] = f1
+        X_eval, y_eval, eval_weight = self.evaluation_data()
+        self.predictions = {name: model.predict(X_eval) for name, model in self.models.items()}
+        self.model_intervals = self.bootstrap_model_metrics()
 
-        self.best_model_name = max(scores, key=scores.get)
+        # Prefer the model whose F1 stays highest under resampling, then the higher point estimate,
+        # so close models are not picked on noise
+        f1 = {name: intervals['f1_weighted'] for name, intervals in self.model_intervals.items()}
+        self.best_model_name = max(f1, key=lambda name: (f1[name]['low'], f1[name]['estimate']))
         self.best_model = self.models[self.best_model_name]
         print("Model training COMPLETED!")
 
+    def bootstrap_model_metrics(self, n_resamples=2000, alpha=0.05, random_state=42):
+        """
+        Bootstrap confidence intervals of every model's metrics from the cached predictions.
+        All models share the same resamples, so their intervals are paired.
+        """
+        y_true = np.asarray(self.evaluation_data()[1])
+        predictions = self.predictions
+        if self.compress_duplicates:
+            # Resample patients, not unique rows
+            y_true = y_true[self.row_index]
+            predictions = {name: y_pred[self.row_index] for name, y_pred in predictions.items()}
+
+        evaluator = BootstrapEvaluator(n_resamples, alpha, random_state)
+        return evaluator.evaluate(y_true, predictions, len(self.target.classes_))
+
         
 
     def display_model_performance_summary(self):
-        if not self.models:
-            print("No models have been trained yet.")
-            return
+        with self.acquire_snapshot() as snapshot:
+            if snapshot is None:
+                print("No models have been trained yet.")
+                return
 
-        print("\n=== Model Performance Summary ===")
-        for name, model in self.models.items():
-            y_pred = model.predict(self.X)
-            print(classification_report(self.y, y_pred, target_names=self.target.classes_))
-            f1 = f1_score(self.y, y_pred, average='weighted')
-            print(f"{name}: F1 (weighted) = {f1:.4f}")
+            print("\n=== Model Performance Summary ===")
+            X_eval, y_eval, eval_weight = snapshot.evaluation_data
+            for name, model in snapshot.models.items():
+                y_pred = model.predict(X_eval)
+                print(classification_report(y_eval, y_pred, target_names=snapshot.target.classes_, sample_weight=eval_weight))
+                f1 = f1_score(y_eval, y_pred, average='weighted', sample_weight=eval_weight)
+                print(f"{name}: F1 (weighted) = {f1:.4f}")
+                if name in snapshot.model_intervals:
+                    intervals = snapshot.model_intervals[name]
+                    level = intervals['level'] * 100
+                    for metric, label in (('f1_weighted', 'F1 (weighted)'), ('accuracy', 'Accuracy')):
+                        print(f"  {label} {level:.0f}% CI: [{intervals[metric]['low']:.4f}, {intervals[metric]['high']:.4f}]")
+                    for i, class_name in enumerate(snapshot.target.classes_):
+                        precision, recall = intervals['precision'], intervals['recall']
+                        print(f"  {class_name}: precision [{precision['low'][i]:.4f}, {precision['high'][i]:.4f}], "
+                              f"recall [{recall['low'][i]:.4f}, {recall['high'][i]:.4f}]")
 
     def display_tuning_results(self):
-        if not self.tuned_model_scores:
-            print("No tuning results available.")
-            return
+        with self.acquire_snapshot() as snapshot:
+            if snapshot is None or not snapshot.tuned_model_scores:
+                print("No tuning results available.")
+                return
 
-        print("\n=== Hyperparameter Tuning Results ===")
-        for name, info in self.tuned_model_scores.items():
-            print(f"Tuning hyperparameters for: {name}")
-            print(f"Best parameters: {info['params']}")
-            print(f"Best F1 (weighted): {info['score']:.4f}")
+            print("\n=== Hyperparameter Tuning Results ===")
+            for name, info in snapshot.tuned_model_scores.items():
+                print(f"Tuning hyperparameters for: {name}")
+                print(f"Best parameters: {info['params']}")
+                print(f"Best F1 (weighted): {info['score']:.4f}")
 
     def display_available_models(self):
-        print("\nAvailable Models:")
-        for name in self.models.keys():
-            print(f"- {name}")
+        with self.acquire_snapshot() as snapshot:
+            print("\nAvailable Models:")
+            for name in (snapshot.models if snapshot else {}):
+                print(f"- {name}")
 
     def display_best_model(self):
-        if self.best_model_name:
-            y_pred = self.best_model.predict(self.X)
-            f1 = f1_score(self.y, y_pred, average='weighted')
-            print(f"\nBest Model: {self.best_model_name} with F1 (weighted) = {f1:.4f}")
-        else:
-            print("No best model has been selected yet.")
+        with self.acquire_snapshot() as snapshot:
+            if snapshot is not None:
+                X_eval, y_eval, eval_weight = snapshot.evaluation_data
+                y_pred = snapshot.best_model.predict(X_eval)
+                f1 = f1_score(y_eval, y_pred, average='weighted', sample_weight=eval_weight)
+                print(f"\nBest Model: {snapshot.best_model_name} with F1 (weighted) = {f1:.4f}")
+            else:
+                print("No best model has been selected yet.")
 
     def internal_test(self, model_name="Logistic Regression (Tuned)", sample_size=5):
-        if model_name not in self.models:
-            print(f"Model '{model_name}' not found.")
-            return
+        with self.acquire_snapshot() as snapshot:
+            if snapshot is None or model_name not in snapshot.models:
+                print(f"Model '{model_name}' not found.")
+                return
 
-        model = self.models[model_name]
-        sample = self.X.iloc[:sample_size]
-        predictions = model.predict(sample)
-        decoded = self.target.inverse_transform(predictions)
+            model = snapshot.models[model_name]
+            sample = snapshot.X[:sample_size] if sparse.issparse(snapshot.X) else snapshot.X.iloc[:sample_size]
+            predictions = model.predict(sample)
+            decoded = snapshot.target.inverse_transform(predictions)
 
         print(f"\nInternal Test using {model_name}")
         print("Sample input:\n", sample)
         print("Predicted subtypes:", decoded)
 
     def external_test(self, input_dict, model_name="Logistic Regression (Tuned)"):
-        if model_name not in self.models:
-            print(f"Model '{model_name}' not found.")
-            return
+        """
+        model_name None predicts with the best model of the snapshot serving this request.
+        """
+        with self.acquire_snapshot() as snapshot:
+            model_name = model_name or (snapshot.best_model_name if snapshot else None)
+            if snapshot is None or model_name not in snapshot.models:
+                print(f"Model '{model_name}' not found.")
+                return
+            try:
+                decoded = snapshot.predict(input_dict, model_name)
+            except ValueError as e:
+                print(f"Cannot predict this input: {e}")
+                return
 
-        model = self.models[model_name]
-        encoded_input = {}
+        print("Predicted Subtype:", decoded)
+
+    def export_inference_artifact(self, filepath, model_name=None):
+        """
+        Compiles a trained model (default: the best model) into a NumPy-only artifact for predictor.py.
+        """
+        with self.acquire_snapshot() as snapshot:
+            model_name = model_name or (snapshot.best_model_name if snapshot else None)
+            if snapshot is None or model_name not in snapshot.models:
+                print(f"Model '{model_name}' not found.")
+                return
+
+            artifact = ModelCompiler().compile(snapshot.models[model_name])
+            artifact['model_name'] = np.array(model_name)
+            artifact['feature_names'] = np.array(snapshot.feature_names, dtype=str)
+            artifact['target_classes'] = np.array(snapshot.target.classes_, dtype=str)
+            artifact['gene_status_encoding'] = np.array(snapshot.gene_status_encoding)
+            for col, label_encoder in snapshot.label_encoders.items():
+                artifact['encoder_' + col] = np.array(label_encoder.classes_, dtype=str)
+
+            np.savez(filepath, **artifact)
+
+            # Parity check: the artifact must reproduce the model on the evaluation data,
+            # in row chunks, so a wide gene panel is never densified as a whole
+            X_eval = snapshot.evaluation_data[0]
+            predictor = CompiledPredictor(filepath)
+            mismatches = 0
+            for start in range(0, X_eval.shape[0], 1024):
+                X_chunk = _safe_indexing(X_eval, np.arange(start, min(start + 1024, X_eval.shape[0])))
+                expected = snapshot.target.inverse_transform(snapshot.models[model_name].predict(X_chunk))
+                X_dense = X_chunk.toarray() if sparse.issparse(X_chunk) else np.asarray(X_chunk, dtype=np.float64)
+                mismatches += int((predictor.predict(X_dense) != expected).sum())
+            if mismatches:
+                os.remove(filepath)
+                raise ValueError(f"Compiled {model_name} disagrees with the trained model on {mismatches} rows.")
+        print(f"Exported {model_name} inference artifact to: {filepath}")
+
+
+class ModelSnapshot:
+    """
+    Immutable trained state of a MachineLearningService: models, encoders, target, best model and the
+    data the stats are computed on. Retraining builds a new snapshot instead of changing this one.
+    """
+    def __init__(self, service):
+        state = {
+            "models": MappingProxyType(dict(service.models)),
+            "best_model_name": service.best_model_name,
+            "best_model": service.best_model,
+            "label_encoders": MappingProxyType(dict(service.label_encoders)),
+            "target": service.target,
+            "feature_names": tuple(service.feature_names),
+            "gene_status_encoding": service.gene_matrix is not None,
+            "X": service.X,
+            "y": service.y,
+            "evaluation_data": service.evaluation_data(),
+            "tuned_model_scores": MappingProxyType(dict(service.tuned_model_scores)),
+            "model_intervals": MappingProxyType(dict(service.model_intervals))
+        }
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ModelSnapshot is immutable, retrain to build a new one.")
 
+    def __getstate__(self):
+        return {key: dict(value) if isinstance(value, MappingProxyType) else value for key, value in self.__dict__.items()}
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            object.__setattr__(self, key, MappingProxyType(value) if isinstance(value, dict) else value)
+
+    def encode_input(self, input_dict):
+        """
+        Encodes one external input dict into a single model row.
+        """
+        unknown = [col for col in input_dict if col not in self.feature_names]
+        if unknown:
+            raise ValueError(f"Unknown features: {', '.join(unknown)}.")
+        # Only gene panel results may be left out, they encode as 0 ("missing")
+        required = [col for col in self.feature_names if not self.gene_status_encoding or col in ('gender', 'age')]
+        missing = [col for col in required if col not in input_dict]
+        if missing:
+            raise ValueError(f"Missing features: {', '.join(missing)}.")
+
+        # Each partition fits its own encoders, a value it never saw has no model
+        for col, value in input_dict.items():
+            if col in self.label_encoders and value not in self.label_encoders[col].classes_:
+                raise ValueError(f"Unknown value '{value}' for '{col}'.")
+
+        if self.gene_status_encoding:
+            row = np.zeros((1, len(self.feature_names)))
+            for col, value in input_dict.items():
+                if col in self.label_encoders:
+                    value = self.label_encoders[col].transform([value])[0]
+                elif col not in ('gender', 'age'):
+                    value = {'POSITIVE': 1, 'NEGATIVE': -1}.get(str(value).upper(), 0)
+                row[0, self.feature_names.index(col)] = value
+            return sparse.csr_matrix(row)
+
+        encoded_input = {}
         for col, value in input_dict.items():
             if col in self.label_encoders:
                 le = self.label_encoders[col]
                 encoded_input[col] = le.transform([value])[0]
             else:
                 encoded_input[col] = value
+        return pd.DataFrame([encoded_input], columns=list(self.feature_names))
+
+    def predict(self, input_dict, model_name):
+        """
+        Returns the decoded subtype of one external input dict.
+        """
+        prediction = self.models[model_name].predict(self.encode_input(input_dict))
+        return self.target.inverse_transform(prediction)[0]
+
+
+class BootstrapEvaluator:
+    """
+    Vectorized bootstrap of classification metrics: one (resamples x samples) index matrix,
+    confusion matrices counted with a single bincount per chunk of resamples.
+    """
+    def __init__(self, n_resamples=2000, alpha=0.05, random_state=42, max_chunk_cells=4_000_000):
+        self.n_resamples = n_resamples
+        self.alpha = alpha
+        self.random_state = random_state
+        self.max_chunk_cells = max_chunk_cells
+
+    def confusion_matrices(self, y_true, y_pred, indices, n_classes):
+        """
+        Returns (resamples, true class, predicted class) counts for the rows of indices.
+        """
+        n_resamples = indices.shape[0]
+        cells = np.arange(n_resamples)[:, None] * n_classes * n_classes + y_true[indices] * n_classes + y_pred[indices]
+        counts = np.bincount(cells.ravel(), minlength=n_resamples * n_classes * n_classes)
+        return counts.reshape(n_resamples, n_classes, n_classes)
+
+    def metrics(self, confusion):
+        """
+        Accuracy, per-class precision/recall and weighted F1 of stacked confusion matrices,
+        undefined ratios count as 0 like scikit-learn's default zero_division.
+        """
+        correct = np.diagonal(confusion, axis1=-2, axis2=-1).astype(np.float64)
+        support = confusion.sum(axis=-1)
+        predicted = confusion.sum(axis=-2)
+        total = support.sum(axis=-1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predicted > 0, correct / predicted, 0.0)
+            recall = np.where(support > 0, correct / support, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+            f1_weighted = np.where(total > 0, (f1 * support).sum(axis=-1) / total, 0.0)
+            accuracy = np.where(total > 0, correct.sum(axis=-1) / total, 0.0)
+
+        return {'f1_weighted': f1_weighted, 'accuracy': accuracy, 'precision': precision, 'recall': recall}
+
+    def evaluate(self, y_true, predictions, n_classes):
+        """
+        Returns {model: {metric: {"estimate", "low", "high"}, "level": 1 - alpha}} for encoded labels.
+        """
+        y_true = np.asarray(y_true, dtype=np.intp)
+        predictions = {name: np.asarray(y_pred, dtype=np.intp) for name, y_pred in predictions.items()}
+        n_samples = len(y_true)
+        rng = np.random.default_rng(self.random_state)
+
+        samples = {name: {metric: [] for metric in ('f1_weighted', 'accuracy', 'precision', 'recall')}
+                   for name in predictions}
+        chunk = max(1, self.max_chunk_cells // max(n_samples, 1))
+        for start in range(0, self.n_resamples, chunk):
+            indices = rng.integers(0, n_samples, size=(min(chunk, self.n_resamples - start), n_samples))
+            for name, y_pred in predictions.items():
+                for metric, values in self.metrics(self.confusion_matrices(y_true, y_pred, indices, n_classes)).items():
+                    samples[name][metric].append(values)
+
+        quantiles = [self.alpha / 2 * 100, (1 - self.alpha / 2) * 100]
+        results = {}
+        for name, y_pred in predictions.items():
+            full = self.confusion_matrices(y_true, y_pred, np.arange(n_samples)[None, :], n_classes)
+            estimates = self.metrics(full)
+            results[name] = {"level": 1 - self.alpha}
+            for metric, values in samples[name].items():
+                low, high = np.percentile(np.concatenate(values), quantiles, axis=0)
+                results[name][metric] = {"estimate": estimates[metric][0], "low": low, "high": high}
+        return results
+
+
+def train_partition(partition, file_path, compress_duplicates):
+    """
+    Runs the full training pipeline for one partition, returns (partition, service, error).
+    """
+    try:
+        # Partitions already run in parallel, so tuning inside a partition stays in-process
+        service = MachineLearningService(file_path, compress_duplicates=compress_duplicates, n_jobs=1)
+        service.run()
+        return partition, service, None
+    except Exception as e:
+        return partition, None, str(e)
+
+
+class MultiCohortService:
+    """
+    Trains one model set per partition (e.g. per project_id) concurrently in a process pool
+    and routes predictions to the best model of the input's partition.
+    """
+    def __init__(self, partition_files, partition_key='project_id', compress_duplicates=False, max_workers=-1):
+        self.partition_files = partition_files
+        self.partition_key = partition_key
+        self.compress_duplicates = compress_duplicates
+        self.max_workers = max_workers
+
+        # partition -> {"file_path", "service", "best_model", "score", "error"}
+        self.registry = {}
+
+    def run(self):
+        print(f"Training {len(self.partition_files)} partitions by {self.partition_key}...")
+        results = Parallel(n_jobs=self.max_workers)(
+            delayed(train_partition)(partition, file_path, self.compress_duplicates)
+            for partition, file_path in self.partition_files.items()
+        )
+
+        for partition, service, error in results:
+            entry = {
+                "file_path": self.partition_files[partition],
+                "service": service,
+                "best_model": None,
+                "score": None,
+                "error": error
+            }
+            if service is not None:
+                X_eval, y_eval, eval_weight = service.snapshot.evaluation_data
+                y_pred = service.snapshot.best_model.predict(X_eval)
+                entry["best_model"] = service.snapshot.best_model_name
+                entry["score"] = f1_score(y_eval, y_pred, average='weighted', sample_weight=eval_weight)
+            self.registry[partition] = entry
+        return self.registry
+
+    def available_partitions(self):
+        return [partition for partition, entry in self.registry.items() if entry["service"] is not None]
+
+    def external_test(self, input_dict):
+        """
+        Predicts with the best model of the partition named by input_dict[partition_key].
+        """
+        input_dict = dict(input_dict)
+        partition = str(input_dict.pop(self.partition_key, None))
+        entry = self.registry.get(partition)
+        if entry is None or entry["service"] is None:
+            print(f"No trained model for {self.partition_key} '{partition}'.")
+            return
+        service = entry["service"]
+        print(f"{self.partition_key} {partition} -> {service.snapshot.best_model_name}")
+        service.external_test(input_dict, model_name=None)
+
+    def export_inference_artifacts(self):
+        """
+        Writes best_model.npz next to each partition's CSV.
+        """
+        for partition in self.available_partitions():
+            folder = os.path.dirname(self.registry[partition]["file_path"])
+            self.registry[partition]["service"].export_inference_artifact(os.path.join(folder, "best_model.npz"))
+
+    def display_registry(self):
+        print(f"\n=== Models per {self.partition_key} ===")
+        for partition, entry in self.registry.items():
+            if entry["error"]:
+                print(f"{partition}: training failed ({entry['error']})")
+            else:
+                print(f"{partition}: {entry['best_model']} with F1 (weighted) = {entry['score']:.4f}")
+
 
-        df_input = pd.DataFrame([encoded_input])
-        prediction = model.predict(df_input)
-        decoded = self.target.inverse_transform(prediction)
+def evaluate_fold(name, model, params, fold, X, y, split, scoring):
+    """
+    Fits one (params, fold) grid point and returns its test score, nan on failure like GridSearchCV.
+    """
+    train, train_weight, test, test_weight = split
+    fit_params = {} if train_weight is None else {'sample_weight': train_weight}
+    estimator = clone(model).set_params(**params)
+    try:
+        estimator.fit(_safe_indexing(X, train), _safe_indexing(y, train), **fit_params)
+        score = get_scorer(scoring)(estimator, _safe_indexing(X, test), _safe_indexing(y, test),
+                                    sample_weight=test_weight)
+    except Exception as e:
+        warnings.warn(f"Fit failed for {params} on fold {fold}: {e}")
+        score = np.nan
+    return name, params, fold, float(score)
+
+
+class CountWeightedKNeighborsClassifier(KNeighborsClassifier):
+    """
+    Euclidean KNN where the optional sample_weight holds the duplicate count of each (unique) row.
+    Votes come from predictor.knn_votes: rows tied at the k-th distance share the remaining slots,
+    so predictions do not depend on row order, the compressed data votes exactly like the expanded
+    rows and compiled artifacts predict the same labels.
+    """
+    def fit(self, X, y, sample_weight=None):
+        super().fit(X, y)
+        if self.effective_metric_ != 'euclidean' or self.weights not in ('uniform', 'distance'):
+            raise ValueError("Only euclidean KNN with uniform or distance weights is supported.")
+        n_samples = self.n_samples_fit_
+        self.sample_counts_ = np.ones(n_samples) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        return self
+
+    def candidates(self, X):
+        """
+        (query, row, squared distance) of every training row up to each query's k-th distance, counting
+        duplicates. kneighbors finds them; queries whose ties reach past the returned rows ask again
+        with twice as many neighbours.
+        """
+        fit_X = self._fit_X
+        n_fit = self.n_samples_fit_
+        k = int(min(self.n_neighbors, self.sample_counts_.sum()))
+        n_neighbors = min(k, n_fit)
+        pending = np.arange(X.shape[0])
+        queries, rows = [], []
+        while pending.size:
+            X_pending = X.iloc[pending] if hasattr(X, 'iloc') else X[pending]
+            distances, indices = self.kneighbors(X_pending, n_neighbors=n_neighbors)
+            covered = np.cumsum(self.sample_counts_[indices], axis=1)
+            kth = distances[np.arange(len(pending)), np.argmax(covered >= k, axis=1)]
+            complete = (distances[:, -1] > kth) | (n_neighbors == n_fit)
+            within = complete[:, None] & (distances <= kth[:, None])
+            queries.append(np.broadcast_to(pending[:, None], within.shape)[within])
+            rows.append(indices[within])
+            pending = pending[~complete]
+            n_neighbors = min(2 * n_neighbors, n_fit)
+
+        query, row = np.concatenate(queries), np.concatenate(rows)
+        # Exact squared distances, computed the same way as CompiledPredictor.predict_knn
+        if sparse.issparse(fit_X):
+            diff = sparse.csr_matrix(X, dtype=np.float64)[query] - fit_X[row]
+            sq_distances = np.asarray(diff.multiply(diff).sum(axis=1)).ravel()
+        else:
+            diff = np.asarray(X, dtype=np.float64)[query] - fit_X[row]
+            sq_distances = (diff * diff).sum(axis=1)
+        return query, row, sq_distances
+
+    def predict_proba(self, X):
+        query, row, sq_distances = self.candidates(X)
+        votes = knn_votes(query, row, sq_distances, X.shape[0], self._y, self.sample_counts_,
+                          self.n_neighbors, len(self.classes_), self.weights)
+        return votes / votes.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class SharedTrainingMatrix:
+    """
+    Context manager that dumps the encoded training matrix once to a read-only memory-mapped file.
+    Workers receive the memmap by reference, so they read the same pages instead of getting a copy.
+    """
+    def __init__(self, X):
+        if sparse.issparse(X):
+            self.X = X.tocsr()
+        else:
+            self.X = np.ascontiguousarray(np.asarray(X, dtype=np.float64))
+        self.folder = None
+
+    def __enter__(self):
+        self.folder = tempfile.mkdtemp(prefix="training_matrix_")
+        path = os.path.join(self.folder, "X.joblib")
+        joblib.dump(self.X, path)
+        return joblib.load(path, mmap_mode='r')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        return False
+
+
+class TuningResultStore:
+    """
+    Append-only JSON lines store of fold evaluations, keyed by a hash of the training data.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def data_hash(self, X, y, cv, scoring, compressed=False):
+        digest = hashlib.sha256()
+        if sparse.issparse(X):
+            X = X.tocsr()
+            for part in (X.data, X.indices, X.indptr, np.array(X.shape)):
+                digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(np.ascontiguousarray(np.asarray(X, dtype=np.float64)).tobytes())
+            digest.update(json.dumps(list(getattr(X, 'columns', []))).encode())
+        digest.update(np.ascontiguousarray(np.asarray(y)).tobytes())
+        digest.update(f"{cv!r}|{scoring}|compressed={compressed}".encode())
+        return digest.hexdigest()
+
+    def params_key(self, params):
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def load(self, data_hash, model_name, estimator_key):
+        """
+        Returns {(params_key, fold): score} of finished evaluations for one model.
+        """
+        finished = {}
+        if not os.path.exists(self.file_path):
+            return finished
+        with open(self.file_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Partial last line from an interrupted run
+                    continue
+                if (record["data_hash"] == data_hash and record["model"] == model_name
+                        and record["estimator"] == estimator_key):
+                    finished[(record["params"], record["fold"])] = record["score"]
+        return finished
+
+    def append(self, data_hash, model_name, estimator_key, params, fold, score):
+        record = {
+            "data_hash": data_hash,
+            "model": model_name,
+            "estimator": estimator_key,
+            "params": self.params_key(params),
+            "fold": fold,
+            "score": score
+        }
+        with open(self.file_path, "a+b") as f:
+            # Start on a fresh line if an interrupted run left a partial record
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write((json.dumps(record) + "\n").encode())
+
+
+class ModelCompiler:
+    """
+    Flattens fitted scikit-learn models into plain NumPy arrays (see predictor.CompiledPredictor).
+    """
+
+    def compile(self, model):
+        if isinstance(model, LogisticRegression):
+            artifact = self.compile_linear(model)
+        elif isinstance(model, SVC):
+            artifact = self.compile_svc(model)
+        elif isinstance(model, RandomForestClassifier):
+            artifact = self.compile_forest(model)
+        elif isinstance(model, KNeighborsClassifier):
+            artifact = self.compile_knn(model)
+        else:
+            raise ValueError(f"Cannot compile model of type {type(model).__name__}.")
+        artifact['model_classes'] = np.asarray(model.classes_)
+        return artifact
+
+    def compile_linear(self, model):
+        return {
+            'kind': np.array('linear'),
+            'coef': np.asarray(model.coef_, dtype=np.float64),
+            'intercept': np.asarray(model.intercept_, dtype=np.float64)
+        }
+
+    def compile_svc(self, model):
+        if model.kernel != 'linear':
+            raise ValueError("Only linear SVC models can be compiled.")
+        n_classes = len(model.classes_)
+        pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+        coef = model.coef_.toarray() if sparse.issparse(model.coef_) else model.coef_
+        return {
+            'kind': np.array('ovo_linear'),
+            'coef': np.asarray(coef, dtype=np.float64),
+            'intercept': np.asarray(model.intercept_, dtype=np.float64),
+            'pairs': np.array(pairs, dtype=np.intp).reshape(-1, 2)
+        }
+
+    def compile_forest(self, model):
+        children_left, children_right, feature, threshold, missing_left, value, roots = [], [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            roots.append(offset)
+            # Rebase child indices so all trees share one flat node array
+            children_left.append(np.where(is_leaf, -1, tree.children_left + offset))
+            children_right.append(np.where(is_leaf, -1, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            missing_left.append(np.asarray(tree.missing_go_to_left, dtype=bool))
+            proba = tree.value[:, 0, :]
+            value.append(proba / proba.sum(axis=1, keepdims=True))
+            offset += tree.node_count
+
+        return {
+            'kind': np.array('forest'),
+            'children_left': np.concatenate(children_left).astype(np.intp),
+            'children_right': np.concatenate(children_right).astype(np.intp),
+            'feature': np.concatenate(feature).astype(np.intp),
+            'threshold': np.concatenate(threshold),
+            'missing_go_to_left': np.concatenate(missing_left),
+            'value': np.concatenate(value),
+            'roots': np.array(roots, dtype=np.intp)
+        }
+
+    def compile_knn(self, model):
+        # Plain KNeighborsClassifier breaks distance ties by tree / partition order, which cannot be reproduced
+        if not isinstance(model, CountWeightedKNeighborsClassifier):
+            raise ValueError("Only CountWeightedKNeighborsClassifier KNN models can be compiled.")
+        fit_X = model._fit_X.toarray() if sparse.issparse(model._fit_X) else model._fit_X
+        return {
+            'kind': np.array('knn'),
+            'fit_X': np.asarray(fit_X, dtype=np.float64),
+            'fit_y': np.asarray(model._y, dtype=np.intp),
+            'fit_counts': np.asarray(model.sample_counts_, dtype=np.float64),
+            'n_neighbors': np.array(model.n_neighbors),
+            'weights': np.array(model.weights)
+        }
 
-        print("Predicted Subtype:", decoded[0])
\ No newline at end of file
@@ -0,0 +1,212 @@
+import sys
+import numpy as np
+
+"""
+Lightweight predictor for compiled model artifacts.
+
+This module loads the NumPy-only artifact written by MachineLearningService.export_inference_artifact
+and predicts subtypes without importing pandas or scikit-learn, so the first prediction is available
+in milliseconds instead of after a full model rebuild.
+
+Components:
+- CompiledPredictor: Loads an artifact, encodes raw inputs and predicts subtypes.
+- knn_votes: KNN voting with order-independent ties, shared with MachineLearningService's KNN.
+
+Usage:
+    python predictor.py datasets/best_model.npz gender=FEMALE age=50 ESR1=POSITIVE PGR=POSITIVE ERBB2=NEGATIVE
+
+"""
+
+class CompiledPredictor:
+    """
+    Predicts subtypes from a compiled linear, one-vs-one linear, forest or KNN artifact.
+    """
+    def __init__(self, file_path):
+        with np.load(file_path, allow_pickle=False) as f:
+            self.arrays = {key: f[key] for key in f.files}
+
+        self.kind = str(self.arrays['kind'])
+        self.model_name = str(self.arrays['model_name'])
+        self.feature_names = self.arrays['feature_names'].tolist()
+        self.target_classes = self.arrays['target_classes']
+        self.model_classes = self.arrays['model_classes']
+        # Sparse gene panel models encode gene results as 1 / -1 / 0 instead of label encoders
+        self.gene_status_encoding = bool(self.arrays['gene_status_encoding'])
+
+        self.label_encoders = {}
+        for key, values in self.arrays.items():
+            if key.startswith('encoder_'):
+                self.label_encoders[key[len('encoder_'):]] = {value: code for code, value in enumerate(values.tolist())}
+
+    def encode(self, input_dict):
+        """
+        Encodes one raw input dict into a feature row, like MachineLearningService.encode_input.
+        """
+        unknown = [col for col in input_dict if col not in self.feature_names]
+        if unknown:
+            raise ValueError(f"Unknown features: {', '.join(unknown)}.")
+        # Only gene panel results may be left out, they encode as 0 ("missing")
+        required = [col for col in self.feature_names if not self.gene_status_encoding or col in ('gender', 'age')]
+        missing = [col for col in required if col not in input_dict]
+        if missing:
+            raise ValueError(f"Missing features: {', '.join(missing)}.")
+
+        row = np.zeros(len(self.feature_names))
+        for col, value in input_dict.items():
+            if col in self.label_encoders:
+                if value not in self.label_encoders[col]:
+                    raise ValueError(f"Unknown value '{value}' for '{col}'.")
+                value = self.label_encoders[col][value]
+            elif self.gene_status_encoding and col not in ('gender', 'age'):
+                value = {'POSITIVE': 1, 'NEGATIVE': -1}.get(str(value).upper(), 0)
+            row[self.feature_names.index(col)] = float(value)
+        return row
+
+    def predict(self, X):
+        """
+        Predicts subtype labels for an encoded (n_samples, n_features) matrix.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if self.kind == 'linear':
+            class_index = self.predict_linear(X)
+        elif self.kind == 'ovo_linear':
+            class_index = self.predict_ovo_linear(X)
+        elif self.kind == 'forest':
+            class_index = self.predict_forest(X)
+        elif self.kind == 'knn':
+            class_index = self.predict_knn(X)
+        else:
+            raise ValueError(f"Unsupported artifact kind '{self.kind}'.")
+        return self.target_classes[self.model_classes[class_index]]
+
+    def predict_input(self, input_dict):
+        return self.predict(self.encode(input_dict))[0]
+
+    def predict_linear(self, X):
+        scores = X @ self.arrays['coef'].T + self.arrays['intercept']
+        if scores.shape[1] == 1:
+            return (scores[:, 0] > 0).astype(np.intp)
+        return np.argmax(scores, axis=1)
+
+    def predict_ovo_linear(self, X):
+        # libsvm one-vs-one voting, pair k = (i, j) votes i when its decision is positive
+        scores = X @ self.arrays['coef'].T + self.arrays['intercept']
+        pairs = self.arrays['pairs']
+        if len(self.model_classes) == 2:
+            return (scores[:, 0] > 0).astype(np.intp)
+        winners = np.where(scores > 0, pairs[:, 0], pairs[:, 1])
+        votes = np.zeros((X.shape[0], len(self.model_classes)), dtype=np.intp)
+        np.add.at(votes, (np.arange(X.shape[0])[:, None], winners), 1)
+        return np.argmax(votes, axis=1)
+
+    def predict_forest(self, X):
+        # Trees compare float32 features against float64 thresholds, same as scikit-learn
+        X = X.astype(np.float32)
+        left = self.arrays['children_left']
+        right = self.arrays['children_right']
+        feature = self.arrays['feature']
+        threshold = self.arrays['threshold']
+        missing_left = self.arrays['missing_go_to_left']
+        roots = self.arrays['roots']
+
+        n_samples = X.shape[0]
+        nodes = np.tile(roots, (n_samples, 1))
+        samples = np.repeat(np.arange(n_samples)[:, None], len(roots), axis=1)
+        active = left[nodes] != -1
+        while active.any():
+            current = nodes[active]
+            values = X[samples[active], feature[current]]
+            go_left = np.where(np.isnan(values), missing_left[current], values <= threshold[current])
+            nodes[active] = np.where(go_left, left[current], right[current])
+            active = left[nodes] != -1
+
+        proba = self.arrays['value'][nodes].mean(axis=1)
+        return np.argmax(proba, axis=1)
+
+    def predict_knn(self, X, max_chunk_cells=1_000_000):
+        fit_X = self.arrays['fit_X']
+        fit_counts = self.arrays['fit_counts']
+        n_neighbors = int(self.arrays['n_neighbors'])
+        # The k-th distance counting duplicates is at most the k-th distance over unique rows
+        n_unique = min(n_neighbors, len(fit_X))
+        fit_norms = (fit_X * fit_X).sum(axis=1)
+        class_index = np.empty(X.shape[0], dtype=np.intp)
+        # Query chunks keep the (chunk, n_fit) distance matrix bounded
+        chunk_size = max(1, max_chunk_cells // max(1, len(fit_X)))
+        for start in range(0, X.shape[0], chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            approx = (X_chunk * X_chunk).sum(axis=1)[:, None] + fit_norms[None, :] - 2 * (X_chunk @ fit_X.T)
+            bound = np.partition(approx, n_unique - 1, axis=1)[:, n_unique - 1]
+            # The formula above rounds, so the candidates get some slack; knn_votes recomputes them exactly
+            query, row = np.nonzero(approx <= (bound + 1e-6 * (1 + np.abs(bound)))[:, None])
+            diff = X_chunk[query] - fit_X[row]
+            votes = knn_votes(query, row, (diff * diff).sum(axis=1), len(X_chunk), self.arrays['fit_y'], fit_counts,
+                              n_neighbors, len(self.model_classes), str(self.arrays['weights']))
+            class_index[start:start + chunk_size] = np.argmax(votes, axis=1)
+        return class_index
+
+
+def knn_votes(query, row, sq_distances, n_queries, fit_y, fit_counts, n_neighbors, n_classes, weights='uniform'):
+    """
+    Returns (n_queries, n_classes) votes of the n_neighbors nearest training rows, every training row
+    counting fit_counts times. Rows tied at the k-th distance share the remaining neighbour slots in
+    proportion to their counts, so the votes do not depend on the order of the training rows and a
+    compressed training set votes exactly like the expanded one.
+
+    The candidates are given as (query, row, squared distance) triples and must hold, for every query,
+    at least each row up to its k-th distance; rows further away are ignored.
+    """
+    k = int(min(n_neighbors, fit_counts.sum()))
+    order = np.lexsort((sq_distances, query))
+    query, row = query[order], row[order]
+    sq_distances = np.maximum(sq_distances[order], 0)
+    counts = fit_counts[row]
+
+    # Per query: first candidate, rank of each distinct distance and the k-th distance counting duplicates
+    starts = np.searchsorted(query, np.arange(n_queries))
+    new_distance = np.ones(len(query), dtype=bool)
+    new_distance[1:] = (sq_distances[1:] != sq_distances[:-1]) | (query[1:] != query[:-1])
+    distinct_seen = np.cumsum(new_distance)
+    rank = distinct_seen - distinct_seen[starts][query]
+    covered = np.cumsum(counts)
+    before = covered[starts] - counts[starts]
+    kth = sq_distances[np.searchsorted(covered, before + k)]
+
+    closer = sq_distances < kth[query]
+    tied = sq_distances == kth[query]
+    closer_counts = np.bincount(query, weights=closer * counts, minlength=n_queries)
+    tied_counts = np.bincount(query, weights=tied * counts, minlength=n_queries)
+    # Slots scaled by tied_counts stay integers, so per class sums are exact whatever the row grouping
+    slots = (closer * tied_counts[query] + tied * (k - closer_counts)[query]) * counts
+
+    # Votes per (query, distinct distance, class); at most k distinct distances hold slots
+    voting = slots > 0
+    query, rank, row, slots = query[voting], rank[voting], row[voting], slots[voting]
+    totals = np.zeros((n_queries, k, n_classes))
+    np.add.at(totals, (query, rank, fit_y[row]), slots)
+
+    if weights == 'distance':
+        distinct = np.full((n_queries, k), np.inf)
+        distinct[query, rank] = sq_distances[voting]
+        with np.errstate(divide='ignore'):
+            inverse = 1.0 / np.sqrt(distinct)
+        # Exact matches take all the weight, same rule as scikit-learn
+        exact_rows = distinct[:, 0] == 0
+        inverse[exact_rows] = 0.0
+        inverse[exact_rows, 0] = 1.0
+        votes = np.zeros((n_queries, n_classes))
+        for r in range(k):
+            votes += totals[:, r] * inverse[:, r:r + 1]
+    else:
+        votes = totals.sum(axis=1)
+    return votes / tied_counts[:, None]
+
+
+if __name__ == "__main__":
+    predictor = CompiledPredictor(sys.argv[1])
+    input_dict = dict(arg.split('=', 1) for arg in sys.argv[2:])
+    try:
+        print(f"Predicted Subtype ({predictor.model_name}):", predictor.predict_input(input_dict))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)